@@ -0,0 +1,122 @@
+from api.include.async_api import (api_response, async_api_view,
+                                   database_sync_to_async)
+from api.include.cache import async_versioned_cache
+from api.include.filters import IngredientFilter
+from api.serializers import (IngredientSerializer, TagSerializer,
+                             ViewRecipeSerializer)
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from django_filters.utils import translate_validation
+from foodgram.routers import replica_reads
+from recipes.counters import add_counted_relation, remove_counted_relation
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.versions import INGREDIENTS_VERSION, TAGS_VERSION
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+
+LOOKUP_METHODS = ('GET', 'HEAD')
+TOGGLE_METHODS = ('POST', 'DELETE')
+
+
+def toggle_recipe(request, pk, model, exists_message, missing_message):
+    """Добавляет рецепт в список пользователя или удаляет из него"""
+    try:
+        if request.method == 'DELETE':
+            if remove_counted_relation(
+                model, user_id=request.user.id, recipe_id=pk
+            ):
+                return api_response(status=status.HTTP_204_NO_CONTENT)
+            return api_response(
+                [missing_message], status=status.HTTP_400_BAD_REQUEST
+            )
+        recipe = add_counted_relation(
+            model, ('name', 'image', 'image_variants_ready', 'cooking_time'),
+            user_id=request.user.id, recipe_id=pk,
+        )
+    except Recipe.DoesNotExist:
+        raise NotFound
+    if recipe is None:
+        return api_response(
+            [exists_message], status=status.HTTP_400_BAD_REQUEST
+        )
+    return api_response(
+        ViewRecipeSerializer(recipe).data, status=status.HTTP_201_CREATED
+    )
+
+
+@async_api_view(TOGGLE_METHODS, authenticated=True)
+async def favorite(request, pk):
+    return await database_sync_to_async(toggle_recipe)(
+        request, pk, Favorite,
+        'Рецепт уже добавлен в избранное',
+        'Рецепт отсутствует в избранном',
+    )
+
+
+@async_api_view(TOGGLE_METHODS, authenticated=True)
+async def shopping_cart(request, pk):
+    return await database_sync_to_async(toggle_recipe)(
+        request, pk, ShoppingCart,
+        'Рецепт уже добавлен в список покупок',
+        'Рецепт отсутствует в списке покупок',
+    )
+
+
+def list_tags(request):
+    return api_response(TagSerializer(Tag.objects.all(), many=True).data)
+
+
+def retrieve_tag(request, pk):
+    return api_response(TagSerializer(get_object_or_404(Tag, pk=pk)).data)
+
+
+def list_ingredients(request):
+    name = request.query_params.get('name')
+    with replica_reads(request):
+        if name and settings.INGREDIENT_INDEX_ENABLED:
+            return api_response(ingredient_index.search(
+                name, settings.INGREDIENT_SEARCH_LIMIT
+            ))
+        filterset = IngredientFilter(
+            request.query_params,
+            queryset=Ingredient.objects.all(),
+            request=request,
+        )
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        queryset = filterset.qs
+        if name:
+            queryset = queryset[:settings.INGREDIENT_SEARCH_LIMIT]
+        return api_response(IngredientSerializer(queryset, many=True).data)
+
+
+def retrieve_ingredient(request, pk):
+    with replica_reads(request):
+        return api_response(
+            IngredientSerializer(get_object_or_404(Ingredient, pk=pk)).data
+        )
+
+
+@async_api_view(LOOKUP_METHODS)
+@async_versioned_cache(TAGS_VERSION)
+async def tag_list(request):
+    return await database_sync_to_async(list_tags)(request)
+
+
+@async_api_view(LOOKUP_METHODS)
+@async_versioned_cache(TAGS_VERSION)
+async def tag_detail(request, pk):
+    return await database_sync_to_async(retrieve_tag)(request, pk)
+
+
+@async_api_view(LOOKUP_METHODS)
+@async_versioned_cache(INGREDIENTS_VERSION)
+async def ingredient_list(request):
+    return await database_sync_to_async(list_ingredients)(request)
+
+
+@async_api_view(LOOKUP_METHODS)
+@async_versioned_cache(INGREDIENTS_VERSION)
+async def ingredient_detail(request, pk):
+    return await database_sync_to_async(retrieve_ingredient)(request, pk)
@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_DB_THREADS,
+    thread_name_prefix='async-db',
+)
+
+
+def database_sync_to_async(func):
+    """Выполняет блокирующий код (ORM, кеш) в пуле потоков async-db.
+
+    В Django 3.2 нет асинхронного ORM, а синхронные представления под
+    ASGI выполняются по очереди в одном общем потоке. Пул ограничивает
+    число одновременных соединений с БД, а соединения потоков пула
+    закрываются по тем же правилам CONN_MAX_AGE, что и в цикле запроса.
+    """
+    @wraps(func)
+    def inner(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(inner, thread_sensitive=False, executor=executor)
+
+
+def api_response(data=None, status=status.HTTP_200_OK):
+    """JSON-ответ, совпадающий по содержимому с ответом DRF"""
+    if data is None:
+        response = HttpResponse(status=status)
+        del response['Content-Type']
+        return response
+    return HttpResponse(
+        JSONRenderer().render(data),
+        content_type=JSONRenderer.media_type,
+        status=status,
+    )
+
+
+def error_response(error):
+    """Ответ на исключение DRF, как у стандартного обработчика"""
+    if isinstance(error.detail, (list, dict)):
+        data = error.detail
+    else:
+        data = {'detail': error.detail}
+    response = api_response(data, status=error.status_code)
+    if error.status_code == status.HTTP_401_UNAUTHORIZED:
+        authenticator = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]()
+        response['WWW-Authenticate'] = authenticator.authenticate_header(None)
+    return response
+
+
+def authenticate(request):
+    """Оборачивает запрос в Request DRF и аутентифицирует пользователя"""
+    request = Request(request, authenticators=[
+        authenticator()
+        for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ])
+    request.user
+    return request
+
+
+def async_api_view(methods, authenticated=False):
+    """Асинхронное представление API без APIView.
+
+    Проверяет метод и аутентификацию теми же классами, что и DRF, и
+    передает в представление Request DRF. Ошибки DRF и Http404
+    превращаются в такие же ответы, как у синхронных представлений.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise exceptions.MethodNotAllowed(request.method)
+                request = await database_sync_to_async(authenticate)(request)
+                if authenticated and not request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated
+                response = await view(request, *args, **kwargs)
+            except Http404:
+                response = error_response(exceptions.NotFound())
+            except exceptions.APIException as error:
+                response = error_response(error)
+            patch_vary_headers(response, ('Accept',))
+            return response
+        # Как и APIView, аутентификация по токену не требует CSRF.
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
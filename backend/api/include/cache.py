@@ -0,0 +1,126 @@
+from functools import wraps
+from hashlib import md5
+
+from api.include.async_api import database_sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag, urlencode
+from foodgram.routers import primary_reads
+from recipes.versions import get_versions
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+def get_normalized_query(request):
+    """Строка запроса с отсортированными параметрами и значениями"""
+    return urlencode(
+        sorted((key, sorted(values)) for key, values in request.GET.lists()),
+        doseq=True,
+    )
+
+
+def get_validators(request, version_names):
+    """ETag и Last-Modified ответа по версиям данных и адресу запроса.
+
+    Версии берутся из памяти процесса и перечитываются не чаще раза в
+    DATA_VERSION_CHECK_INTERVAL секунд, поэтому обычно валидаторы
+    вычисляются без обращения к БД и кешу.
+    """
+    versions = get_versions(version_names)
+    etag = quote_etag(md5(
+        f'{versions}:{request.build_absolute_uri(request.path)}?'
+        f'{get_normalized_query(request)}:'
+        f'{request.META.get("HTTP_ACCEPT", "")}'.encode()
+    ).hexdigest())
+    return etag, int(max(versions))
+
+
+def versioned_cache(*version_names, timeout=None, anonymous_only=False):
+    """Кеширует тело ответа до смены версии данных.
+
+    ETag и Last-Modified вычисляются только по версиям данных, поэтому
+    условный запрос с актуальным If-None-Match получает 304 без
+    сериализаторов, а между проверками версий - и без запросов к БД.
+    С anonymous_only кеш используется только для
+    анонимных запросов: ответы авторизованным пользователям содержат их
+    личные флаги и всегда формируются заново.
+    """
+    if timeout is None:
+        timeout = settings.REFERENCE_CACHE_TIMEOUT
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if anonymous_only and request.user.is_authenticated:
+                response = view(request, *args, **kwargs)
+                patch_vary_headers(response, ('Authorization',))
+                return response
+            etag, last_modified = get_validators(request, version_names)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                cache = caches[settings.API_CACHE_ALIAS]
+                key = f'response:{etag}'
+                data = cache.get(key)
+                if data is None:
+                    # Реплика может отставать от версии, поэтому тело для
+                    # кеша читается из основной БД.
+                    with primary_reads():
+                        response = view(request, *args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return response
+                    cache.set(key, response.data, timeout)
+                else:
+                    response = Response(data)
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            if anonymous_only:
+                patch_vary_headers(response, ('Authorization',))
+            return response
+        return wrapper
+    return decorator
+
+
+def async_versioned_cache(*version_names, timeout=None):
+    """versioned_cache для асинхронных представлений с JSON-ответом.
+
+    В кеше хранится готовое тело ответа, обращения к кешу выполняются в
+    пуле потоков, чтобы сетевой бэкенд кеша не блокировал цикл событий.
+    """
+    if timeout is None:
+        timeout = settings.REFERENCE_CACHE_TIMEOUT
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            etag, last_modified = await database_sync_to_async(
+                get_validators
+            )(request, version_names)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                cache = caches[settings.API_CACHE_ALIAS]
+                key = f'content:{etag}'
+                content = await database_sync_to_async(cache.get)(key)
+                if content is None:
+                    with primary_reads():
+                        response = await view(request, *args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return response
+                    await database_sync_to_async(cache.set)(
+                        key, response.content, timeout
+                    )
+                else:
+                    response = HttpResponse(
+                        content, content_type=JSONRenderer.media_type
+                    )
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -1,31 +1,80 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Exists, IntegerField, OuterRef, Value, When
 from django_filters import rest_framework
-from recipes.models import Ingredient, Recipe
+from foodgram.routers import primary_reads
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeTag,
+                            ShoppingCart, Tag)
+from recipes.search import search_recipes
+from recipes.versions import TAGS_VERSION, get_version
+
+TAG_SLUGS_KEY = 'tag_slugs:{}'
+
+
+def get_tag_choices():
+    """Слаги тегов из кеша, сбрасываемого вместе с версией тегов"""
+    key = TAG_SLUGS_KEY.format(get_version(TAGS_VERSION))
+    slugs = cache.get(key)
+    if slugs is None:
+        with primary_reads():
+            slugs = list(
+                Tag.objects.order_by('slug').values_list('slug', flat=True)
+            )
+        cache.set(key, slugs, settings.REFERENCE_CACHE_TIMEOUT)
+    return [(slug, slug) for slug in slugs]
 
 
 class IngredientFilter(rest_framework.FilterSet):
     name = rest_framework.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith',
+        method='get_name',
+        label='name',
     )
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def get_name(self, queryset, name, value):
+        return queryset.filter(
+            name__icontains=value
+        ).annotate(
+            is_contains_match=Case(
+                When(name__istartswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by(
+            'is_contains_match', 'name'
+        )
+
 
 class RecipeFilter(rest_framework.FilterSet):
+    """Фильтры рецептов на коррелированных подзапросах EXISTS.
+
+    Подзапросы не размножают строки рецепта, поэтому выдача не требует
+    DISTINCT.
+    """
     is_favorited = rest_framework.BooleanFilter(
         method='get_favorite',
         label='favorite',
     )
-    tags = rest_framework.AllValuesMultipleFilter(
-        field_name='tags__slug',
+    tags = rest_framework.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='get_tags',
         label='tags',
     )
+    author = rest_framework.NumberFilter(
+        field_name='author',
+        label='author',
+    )
     is_in_shopping_cart = rest_framework.BooleanFilter(
         method='get_is_in_shopping_cart',
         label='shopping_cart',
     )
+    search = rest_framework.CharFilter(
+        method='get_search',
+        label='search',
+    )
 
     class Meta:
         model = Recipe
@@ -34,18 +83,33 @@ class RecipeFilter(rest_framework.FilterSet):
             'author',
             'is_favorited',
             'is_in_shopping_cart',
+            'search',
         )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Поле проверяет каждый переданный тег по списку вариантов, поэтому
+        # слаги читаются один раз на запрос, а не на каждый тег.
+        self.filters['tags'].extra['choices'] = get_tag_choices()
+
+    def get_tags(self, queryset, name, value):
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__slug__in=value,
+        )))
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_by_user(self, queryset, model, value):
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none() if value else queryset
+        exists = Exists(model.objects.filter(user=user, recipe=OuterRef('pk')))
+        return queryset.filter(exists if value else ~exists)
+
     def get_favorite(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorite__user=self.request.user)
-        return queryset.exclude(
-            favorite__user=self.request.user
-        )
+        return self.filter_by_user(queryset, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(shopping_cart__user=self.request.user)
-        return queryset.exclude(
-            shopping_cart__user=self.request.user
-        )
+        return self.filter_by_user(queryset, ShoppingCart, value)
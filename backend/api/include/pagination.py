@@ -1,5 +1,116 @@
-from rest_framework.pagination import PageNumberPagination
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from recipes.versions import RECIPES_VERSION, get_versions
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class PageNumberLimitPagination(PageNumberPagination):
+    page_size = settings.PAGE_SIZE
     page_size_query_param = 'limit'
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator с дешевым подсчетом количества объектов.
+
+    Для таблиц без фильтров на PostgreSQL берется оценка планировщика,
+    если она не меньше APPROXIMATE_COUNT_THRESHOLD. Точный COUNT кешируется
+    на COUNT_CACHE_TIMEOUT секунд по тексту и параметрам запроса и по
+    версиям данных version_names: их смена сбрасывает кеш сразу.
+    """
+    is_count_exact = True
+
+    def __init__(self, *args, version_names=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version_names = version_names
+
+    def get_estimated_count(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                (queryset.model._meta.db_table,)
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < settings.APPROXIMATE_COUNT_THRESHOLD:
+            return None
+        return row[0]
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.values('pk')
+        estimated_count = self.get_estimated_count(queryset)
+        if estimated_count is not None:
+            self.is_count_exact = False
+            return estimated_count
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        versions = get_versions(self.version_names)
+        key = 'count:' + md5(
+            f'{versions}:{sql}:{params}'.encode()
+        ).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, settings.COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class CachedCountPagination(PageNumberLimitPagination):
+    # Версии данных, смена которых сбрасывает закешированное число объектов.
+    count_versions = ()
+
+    def django_paginator_class(self, object_list, per_page):
+        return CachedCountPaginator(
+            object_list, per_page, version_names=self.count_versions
+        )
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['count_is_exact'] = self.page.paginator.is_count_exact
+        return response
+
+
+class CursorLimitPagination(CursorPagination):
+    ordering = '-id'
+    page_size = settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+
+
+class PageNumberOrCursorPagination(CachedCountPagination):
+    """Постраничная пагинация по page/limit.
+
+    Если в запросе передан параметр cursor (в том числе пустой — для первой
+    страницы), используется пагинация по ключу: стоимость любой страницы
+    одинакова и не требует COUNT.
+    """
+    cursor_pagination_class = CursorLimitPagination
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(PageNumberOrCursorPagination):
+    count_versions = (RECIPES_VERSION,)
@@ -0,0 +1,70 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Строки списка отдаются по частям через stream(), render() используется
+    только для ответов об ошибках. По умолчанию stream() отдает текстовые
+    строки «название - количество единица».
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return '\n'.join(
+            f'{key}: {value}' for key, value in data.items()
+        ).encode(self.charset)
+
+    def stream(self, rows):
+        for row in rows:
+            yield (
+                f"{row['name']} - "
+                f"{row['amount']} "
+                f"{row['measurement_unit']}\n"
+            )
+
+
+class ShoppingCartTextRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class Echo:
+    """Файлоподобный объект, возвращающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartCSVRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('name', 'measurement_unit', 'amount')
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header)
+        for row in rows:
+            yield writer.writerow([row[field] for field in self.header])
+
+
+class ShoppingCartJSONRenderer(ShoppingCartRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def stream(self, rows):
+        separator = '['
+        for row in rows:
+            yield separator + json.dumps(row, ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
@@ -0,0 +1,323 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+from csv import reader
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from recipes.counters import rebuild_counters
+from recipes.images import executor
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from recipes.search import update_search_index
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Follow, User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+TAGS = ('breakfast', 'lunch', 'dinner', 'dessert', 'vegan', 'soup')
+WORDS = ('борщ', 'суп', 'каша', 'салат', 'пирог', 'рагу', 'омлет', 'плов')
+
+
+def percentile(values, percent):
+    """Значение перцентиля методом ближайшего ранга"""
+    ordered = sorted(values)
+    index = max(0, -(-len(ordered) * percent // 100) - 1)
+    return ordered[int(index)]
+
+
+class QueryTimer:
+    """Обертка выполнения SQL, считающая запросы и их суммарное время"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a test database and measure latency, SQL query count and SQL '
+        'time of the main API endpoints.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output',
+            help='Write the JSON report to this file instead of stdout.',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON report to compare against.',
+        )
+        parser.add_argument(
+            '--max-regression',
+            type=float,
+            default=10.0,
+            help='Allowed slowdown against the baseline, in percent.',
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='UTF-8') as file:
+                baseline = json.load(file)
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                for alias in settings.CACHES:
+                    caches[alias].clear()
+                self.seed(options)
+                report = self.run(options)
+            executor.shutdown(wait=True)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+        content = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='UTF-8') as file:
+                file.write(content)
+        else:
+            self.stdout.write(content)
+        if baseline is not None:
+            self.compare(report, baseline, options['max_regression'])
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        path = os.path.join(settings.BASE_DIR, 'recipes/data/ingredients.csv')
+        with open(path, encoding='UTF-8') as file:
+            Ingredient.objects.bulk_create(
+                Ingredient(name=row[0], measurement_unit=row[1])
+                for row in reader(file) if len(row) == 2
+            )
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        Tag.objects.bulk_create(
+            Tag(name=slug, slug=slug, color=f'#{index:06X}')
+            for index, slug in enumerate(TAGS)
+        )
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        User.objects.bulk_create(
+            User(username=f'user{index}', email=f'user{index}@example.com')
+            for index in range(options['users'])
+        )
+        users = list(User.objects.order_by('id'))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=rng.choice(users),
+                name=f'{rng.choice(WORDS)} {index}',
+                text=' '.join(rng.choices(WORDS, k=20)),
+                cooking_time=rng.randint(1, 120),
+                image='recipe/images/benchmark.png',
+            )
+            for index in range(options['recipes'])
+        )
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        per_recipe = min(
+            options['ingredients_per_recipe'], len(ingredient_ids)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(ingredient_ids, per_recipe)
+        )
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, 2)
+        )
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=user, recipe_id=recipe_id)
+                for user in users
+                for recipe_id in rng.sample(
+                    recipe_ids, min(10, len(recipe_ids))
+                )
+            )
+        Follow.objects.bulk_create(
+            Follow(user=user, following=following)
+            for user in users
+            for following in rng.sample(users, min(10, len(users)))
+            if following != user
+        )
+        rebuild_counters()
+        update_search_index()
+
+    def get_endpoints(self, user, recipe_ids):
+        """Сценарии: имя, анонимный ли запрос и функция запроса"""
+        own_recipe = Recipe.objects.filter(author=user).first()
+        body = {
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 10}
+                for ingredient_id in Ingredient.objects.values_list(
+                    'id', flat=True
+                )[:10]
+            ],
+            'tags': list(Tag.objects.values_list('id', flat=True)[:2]),
+            'image': IMAGE,
+            'name': 'benchmark',
+            'text': 'benchmark',
+            'cooking_time': 10,
+        }
+
+        def recipe_id(step):
+            return recipe_ids[step % len(recipe_ids)]
+
+        return (
+            ('recipes_list', False, lambda client, step: client.get(
+                '/api/recipes/', {'page': step % 5 + 1, 'limit': 6}
+            )),
+            ('recipes_list_anonymous', True, lambda client, step: client.get(
+                '/api/recipes/', {'page': step % 5 + 1, 'limit': 6}
+            )),
+            ('recipes_list_filtered', False, lambda client, step: client.get(
+                '/api/recipes/', {
+                    'page': 1, 'limit': 6, 'is_favorited': 1,
+                    'tags': [TAGS[step % len(TAGS)], TAGS[0]],
+                }
+            )),
+            ('recipe_detail', False, lambda client, step: client.get(
+                f'/api/recipes/{recipe_id(step)}/'
+            )),
+            ('recipe_create', False, lambda client, step: client.post(
+                '/api/recipes/', body, format='json'
+            )),
+            ('recipe_update', False, lambda client, step: client.patch(
+                f'/api/recipes/{own_recipe.id}/',
+                {**body, 'name': f'benchmark {step}'},
+                format='json',
+            )),
+            ('favorite_add', False, lambda client, step: client.post(
+                f'/api/recipes/{recipe_id(step)}/favorite/'
+            )),
+            ('favorite_remove', False, lambda client, step: client.delete(
+                f'/api/recipes/{recipe_id(step)}/favorite/'
+            )),
+            ('shopping_cart_add', False, lambda client, step: client.post(
+                f'/api/recipes/{recipe_id(step)}/shopping_cart/'
+            )),
+            ('shopping_cart_remove', False, lambda client, step: client.delete(
+                f'/api/recipes/{recipe_id(step)}/shopping_cart/'
+            )),
+            ('download_shopping_cart', False, lambda client, step: client.get(
+                '/api/recipes/download_shopping_cart/'
+            )),
+            ('subscriptions', False, lambda client, step: client.get(
+                '/api/users/subscriptions/',
+                {'page': 1, 'limit': 6, 'recipes_limit': 3},
+            )),
+            ('ingredients_autocomplete', False,
+             lambda client, step: client.get(
+                 '/api/ingredients/', {'name': WORDS[step % len(WORDS)][:2]}
+             )),
+        )
+
+    def run(self, options):
+        user = User.objects.filter(recipes__isnull=False).first()
+        token = Token.objects.create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        anonymous = APIClient()
+        warmup, iterations = options['warmup'], options['iterations']
+        free_recipe_ids = list(Recipe.objects.exclude(
+            favorite__user=user
+        ).exclude(
+            shopping_cart__user=user
+        ).values_list('id', flat=True)[:warmup + iterations])
+        if len(free_recipe_ids) < warmup + iterations:
+            raise CommandError(
+                'Not enough recipes for the toggle endpoints, '
+                'increase --recipes.'
+            )
+        results = {}
+        for name, is_anonymous, request in self.get_endpoints(
+            user, free_recipe_ids
+        ):
+            endpoint_client = anonymous if is_anonymous else client
+            latencies, query_counts, sql_times = [], [], []
+            for step in range(warmup + iterations):
+                timer = QueryTimer()
+                with connection.execute_wrapper(timer):
+                    started = perf_counter()
+                    response = request(endpoint_client, step)
+                    if hasattr(response, 'streaming_content'):
+                        b''.join(response.streaming_content)
+                    elapsed = perf_counter() - started
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f'{name} returned {response.status_code}.'
+                    )
+                if step < warmup:
+                    continue
+                latencies.append(elapsed * 1000)
+                query_counts.append(timer.count)
+                sql_times.append(timer.seconds * 1000)
+            results[name] = {
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p95_ms': round(percentile(latencies, 95), 3),
+                'queries': percentile(query_counts, 50),
+                'sql_ms': round(percentile(sql_times, 50), 3),
+            }
+        return {
+            'vendor': connection.vendor,
+            'dataset': {
+                'users': options['users'],
+                'recipes': options['recipes'],
+                'ingredients_per_recipe': options['ingredients_per_recipe'],
+                'seed': options['seed'],
+            },
+            'iterations': iterations,
+            'endpoints': results,
+        }
+
+    def compare(self, report, baseline, max_regression):
+        limit = 1 + max_regression / 100
+        regressions = []
+        for name, current in report['endpoints'].items():
+            previous = baseline['endpoints'].get(name)
+            if previous is None:
+                continue
+            for metric in ('p95_ms', 'queries'):
+                if current[metric] > previous[metric] * limit:
+                    regressions.append(
+                        f'{name} {metric}: {previous[metric]} -> '
+                        f'{current[metric]}'
+                    )
+        for regression in regressions:
+            self.stderr.write(regression)
+        if regressions:
+            raise CommandError(
+                f'{len(regressions)} metrics are worse than the baseline by '
+                f'more than {max_regression}%.'
+            )
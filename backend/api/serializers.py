@@ -1,14 +1,29 @@
 import base64
+import binascii
+from collections import Counter
+from io import BytesIO
 
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import transaction
+from recipes.images import variant_urls
 from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
 from rest_framework import serializers
 from users.models import User
 from users.serializers import UserSerializer
 
 
+def get_recipes_limit(request):
+    query_dict = request.query_params
+    if ('recipes_limit' in query_dict
+       and query_dict['recipes_limit'].isdigit()):
+        return int(query_dict['recipes_limit'])
+    return settings.RECIPES_LIMIT
+
+
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         fields = ('id', 'name', 'color', 'slug')
@@ -22,13 +37,77 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'max_size': 'Размер изображения превышает {max_size} байт.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            if len(imgstr) * 3 // 4 > settings.MAX_IMAGE_UPLOAD_SIZE:
+                self.fail('max_size', max_size=settings.MAX_IMAGE_UPLOAD_SIZE)
+            content_type = format.split(':')[-1]
+            ext = content_type.split('/')[-1]
+            data = self.decode(imgstr, 'temp.' + ext, content_type)
         return super().to_internal_value(data)
 
+    def decode(self, imgstr, name, content_type):
+        """Декодирует base64 по частям во временный файл загрузки"""
+        size = len(imgstr) * 3 // 4
+        if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            file = TemporaryUploadedFile(name, content_type, size, None)
+        else:
+            file = InMemoryUploadedFile(
+                BytesIO(), None, name, content_type, size, None
+            )
+        chunk_size = settings.BASE64_DECODE_CHUNK_SIZE
+        try:
+            for start in range(0, len(imgstr), chunk_size):
+                file.write(base64.b64decode(
+                    imgstr[start:start + chunk_size], validate=True
+                ))
+        except (binascii.Error, ValueError):
+            self.fail('invalid_image')
+        if not file.tell():
+            self.fail('invalid_image')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
+
+class ImageVariantsMixin:
+    """Добавляет ссылки на уменьшенные копии изображения рецепта"""
+
+    def get_image_variants(self, obj):
+        if not obj.image:
+            return None
+        variants = variant_urls(obj.image.name, obj.image_variants_ready)
+        request = self.context.get('request')
+        if request is not None:
+            for formats in variants.values():
+                for extension, url in formats.items():
+                    formats[extension] = request.build_absolute_uri(url)
+        return variants
+
+
+class BulkPrimaryKeyRelatedField(serializers.ManyRelatedField):
+    """Список первичных ключей, разрешаемый одним запросом in_bulk"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        try:
+            pks = [int(pk) for pk in data]
+        except (TypeError, ValueError):
+            self.child_relation.fail('incorrect_type', data_type='list')
+        objects = self.child_relation.get_queryset().in_bulk(pks)
+        unknown = [pk for pk in pks if pk not in objects]
+        if unknown:
+            self.child_relation.fail('does_not_exist', pk_value=unknown)
+        return [objects[pk] for pk in pks]
+
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='ingredient.id')
@@ -41,7 +120,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
@@ -51,20 +130,25 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
+                  'text', 'cooking_time')
         model = Recipe
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return user.favorite.filter(recipe=obj.id).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -72,7 +156,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.IntegerField(source='ingredient.id')
+    id = serializers.IntegerField(source='ingredient_id')
     amount = serializers.IntegerField(
         validators=[
             MinValueValidator(settings.MIN_VALUE),
@@ -91,9 +175,10 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         source='recipe_ingredient',
         many=True,
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
+    tags = BulkPrimaryKeyRelatedField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all(),
+        ),
     )
     image = Base64ImageField(use_url=True)
     cooking_time = serializers.IntegerField(
@@ -108,49 +193,92 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         fields = ('ingredients', 'tags', 'image', 'name', 'text',
                   'cooking_time')
 
+    def validate_ingredients(self, value):
+        ids = [element['ingredient_id'] for element in value]
+        duplicates = sorted(
+            id for id, count in Counter(ids).items() if count > 1
+        )
+        if duplicates:
+            raise serializers.ValidationError(
+                f'Ингредиенты указаны повторно: {duplicates}'
+            )
+        ingredients = Ingredient.objects.in_bulk(ids)
+        unknown = [id for id in ids if id not in ingredients]
+        if unknown:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {unknown}'
+            )
+        for element in value:
+            element['ingredient'] = ingredients[element.pop('ingredient_id')]
+        return value
+
+    def validate_tags(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError('Теги указаны повторно')
+        return value
+
     def create_ingredients(self, ingredients, recipe):
-        ingredients_list = []
-        for element in ingredients:
-            id = element['ingredient']['id']
-            ingredient = Ingredient.objects.get(pk=id)
-            amount = element['amount']
-            ingredients_list.append(
-                RecipeIngredient(
-                    ingredient=ingredient,
-                    recipe=recipe,
-                    amount=amount
-                )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                ingredient=element['ingredient'],
+                recipe=recipe,
+                amount=element['amount']
             )
-        RecipeIngredient.objects.bulk_create(ingredients_list)
+            for element in ingredients
+        )
 
     def create_tags(self, tags, recipe):
-        tags_list = []
-        for element in tags:
-            id = element.id
-            tag = Tag.objects.get(pk=id)
-            tags_list.append(
-                RecipeTag(
-                    tag=tag,
-                    recipe=recipe
-                )
-            )
-        RecipeTag.objects.bulk_create(tags_list)
+        RecipeTag.objects.bulk_create(
+            RecipeTag(tag=tag, recipe=recipe) for tag in tags
+        )
 
-    def update(self, instance, validated_data):
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        RecipeTag.objects.filter(recipe=instance).delete()
-        instance.image = validated_data.get('image', instance.image)
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time
+    def update_ingredients(self, ingredients, recipe):
+        current = {
+            row.ingredient_id: row for row in recipe.recipe_ingredient.all()
+        }
+        requested = {
+            element['ingredient'].id: element for element in ingredients
+        }
+        removed = current.keys() - requested.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for id, row in current.items():
+            if id in requested and row.amount != requested[id]['amount']:
+                row.amount = requested[id]['amount']
+                changed.append(row)
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        self.create_ingredients(
+            [element for id, element in requested.items()
+             if id not in current],
+            recipe
         )
 
-        self.create_ingredients(validated_data.pop('recipe_ingredient'),
-                                instance)
-        self.create_tags(validated_data.pop('tags'), instance)
-        instance.save()
-        return instance
+    def update_tags(self, tags, recipe):
+        current = set(recipe.recipe_tag.values_list('tag_id', flat=True))
+        requested = {tag.id for tag in tags}
+        removed = current - requested
+        if removed:
+            RecipeTag.objects.filter(
+                recipe=recipe,
+                tag_id__in=removed
+            ).delete()
+        self.create_tags(
+            [tag for tag in tags if tag.id not in current], recipe
+        )
+
+    def update(self, instance, validated_data):
+        ingredients = validated_data.pop('recipe_ingredient', None)
+        tags = validated_data.pop('tags', None)
+        with transaction.atomic():
+            if ingredients is not None:
+                self.update_ingredients(ingredients, instance)
+            if tags is not None:
+                self.update_tags(tags, instance)
+            return super().update(instance, validated_data)
 
     def create(self, validated_data):
         ingredients = validated_data.pop('recipe_ingredient')
@@ -162,17 +290,18 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         return recipe
 
 
-class ViewRecipeSerializer(serializers.ModelSerializer):
+class ViewRecipeSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         model = Recipe
 
 
 class UserSubscribeSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -180,16 +309,20 @@ class UserSubscribeSerializer(UserSerializer):
                   'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        query_dict = self.context.get('request').query_params
-        if ('recipes_limit' in query_dict
-           and query_dict['recipes_limit'].isdigit()):
-            recipes_limit = int(query_dict['recipes_limit'])
+        """Рецепты автора из контекста recipes_by_author.
+
+        Без него рецепты читаются отдельным запросом, что допустимо только
+        для одного автора: для списка это запрос на каждую строку.
+        """
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is None:
+            if isinstance(self.parent, serializers.ListSerializer):
+                raise ImproperlyConfigured(
+                    'Для списка авторов передайте recipes_by_author в '
+                    'контексте UserSubscribeSerializer'
+                )
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            recipes = Recipe.objects.filter(author=obj)[:recipes_limit]
         else:
-            recipes_limit = settings.RECIPES_LIMIT
-
-        recipes = Recipe.objects.filter(author=obj)[:recipes_limit]
+            recipes = recipes_by_author.get(obj.id, [])
         return ViewRecipeSerializer(recipes, many=True).data
-
-    def get_recipes_count(self, obj):
-        user = obj
-        return user.recipes.all().count()
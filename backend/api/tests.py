@@ -0,0 +1,897 @@
+import threading
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from recipes import images, versions
+from recipes.counters import find_counter_drift
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from recipes.versions import RECIPES_VERSION, bump_version
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+
+@override_settings(DB_REPLICAS=[], DATA_VERSION_CHECK_INTERVAL=60)
+class RecipeFilterTests(TestCase):
+    """Фильтры списка рецептов: выдача и форма SQL"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reader', email='r@x.com')
+        cls.authors = [
+            User.objects.create(username=f'author{i}', email=f'a{i}@x.com')
+            for i in range(2)
+        ]
+        cls.tags = [
+            Tag.objects.create(name=slug, slug=slug, color=f'#00000{i}')
+            for i, slug in enumerate(('breakfast', 'lunch', 'dinner'))
+        ]
+        cls.recipes = []
+        for index in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.authors[index % 2],
+                name=f'recipe {index}',
+                text='text',
+                cooking_time=10,
+                image='recipe/images/test.png',
+            )
+            cls.recipes.append(recipe)
+            # Часть рецептов с двумя тегами: совпадение по обоим не
+            # должно размножать строку рецепта.
+            tags = {cls.tags[index % 3], cls.tags[(index + 1) % 3]}
+            if index % 4:
+                tags = {cls.tags[index % 3]}
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag=tag) for tag in tags
+            )
+            if index % 2 == 0:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if index % 3 == 0:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected_ids(self, tags=None, author=None, favorited=None,
+                     in_cart=None):
+        ids = []
+        for recipe in self.recipes:
+            slugs = set(recipe.recipe_tag.values_list('tag__slug', flat=True))
+            if tags is not None and not slugs & set(tags):
+                continue
+            if author is not None and recipe.author_id != author.id:
+                continue
+            if favorited is not None and favorited != Favorite.objects.filter(
+                user=self.user, recipe=recipe
+            ).exists():
+                continue
+            if in_cart is not None and in_cart != ShoppingCart.objects.filter(
+                user=self.user, recipe=recipe
+            ).exists():
+                continue
+            ids.append(recipe.id)
+        return sorted(ids, reverse=True)
+
+    def get_recipes(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/recipes/', {'limit': 100, **params}
+            )
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        recipe_queries = [
+            query['sql'] for query in queries.captured_queries
+            if 'FROM "recipes_recipe"' in query['sql']
+            and '"recipes_recipetag"' in query['sql']
+        ]
+        return ids, recipe_queries, len(queries.captured_queries)
+
+    def assert_exists_filters(self, sql, *tables):
+        self.assertNotIn('DISTINCT', sql)
+        for table in tables:
+            self.assertRegex(sql, rf'EXISTS\(SELECT .* FROM "{table}"')
+
+    def test_combined_filters(self):
+        params = {
+            'tags': ['breakfast', 'lunch'],
+            'author': self.authors[0].id,
+            'is_favorited': 1,
+            'is_in_shopping_cart': 1,
+        }
+        ids, recipe_queries, _ = self.get_recipes(params)
+        self.assertEqual(ids, self.expected_ids(
+            tags=params['tags'],
+            author=self.authors[0],
+            favorited=True,
+            in_cart=True,
+        ))
+        self.assertTrue(ids)
+        self.assertTrue(recipe_queries)
+        for sql in recipe_queries:
+            self.assert_exists_filters(
+                sql, 'recipes_recipetag', 'recipes_favorite',
+                'recipes_shoppingcart',
+            )
+            self.assertNotRegex(sql, r'JOIN "recipes_recipetag"')
+
+    def test_negated_user_filters(self):
+        ids, recipe_queries, _ = self.get_recipes({
+            'tags': ['dinner'],
+            'is_favorited': 0,
+            'is_in_shopping_cart': 0,
+        })
+        self.assertEqual(ids, self.expected_ids(
+            tags=['dinner'], favorited=False, in_cart=False
+        ))
+        self.assertTrue(ids)
+        for sql in recipe_queries:
+            self.assert_exists_filters(sql, 'recipes_recipetag')
+            self.assertEqual(sql.count('NOT EXISTS'), 2)
+
+    def test_multiple_tags_do_not_duplicate_recipes(self):
+        ids, _, _ = self.get_recipes(
+            {'tags': ['breakfast', 'lunch', 'dinner']}
+        )
+        self.assertEqual(ids, self.expected_ids())
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_query_count_does_not_grow_with_results(self):
+        # Оба запроса с одинаковыми фильтрами: без них PostgreSQL берет
+        # оценку числа строк из статистики, и запросов становится на один
+        # больше. Первые запросы заполняют кеш тегов и версий данных.
+        few_params = {'tags': ['breakfast']}
+        many_params = {'tags': ['breakfast', 'lunch', 'dinner']}
+        self.get_recipes(few_params)
+        self.get_recipes(many_params)
+        few_ids, _, few = self.get_recipes(few_params)
+        many_ids, _, many = self.get_recipes(many_params)
+        self.assertLess(len(few_ids), len(many_ids))
+        self.assertEqual(few, many)
+
+    def test_anonymous_user_filters(self):
+        self.client.force_authenticate(None)
+        ids, _, _ = self.get_recipes({'is_favorited': 1})
+        self.assertEqual(ids, [])
+        ids, _, _ = self.get_recipes({
+            'is_in_shopping_cart': 0, 'author': self.authors[1].id
+        })
+        self.assertEqual(ids, self.expected_ids(author=self.authors[1]))
+
+    def walk_cursor(self, params, limit, on_page=None):
+        """Идентификаторы рецептов со всех страниц по ссылкам next"""
+        ids = []
+        response = self.client.get(
+            '/api/recipes/', {'cursor': '', 'limit': limit, **params}
+        )
+        while True:
+            self.assertEqual(response.status_code, 200)
+            results = response.data['results']
+            self.assertLessEqual(len(results), limit)
+            ids.extend(recipe['id'] for recipe in results)
+            if response.data['next'] is None:
+                return ids
+            if on_page is not None:
+                on_page()
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_pages_with_filters(self):
+        for params, expected in (
+            ({'tags': ['breakfast', 'lunch']},
+             self.expected_ids(tags=['breakfast', 'lunch'])),
+            ({'is_favorited': 1}, self.expected_ids(favorited=True)),
+            ({'author': self.authors[0].id},
+             self.expected_ids(author=self.authors[0])),
+            ({'tags': ['dinner'], 'author': self.authors[1].id,
+              'is_favorited': 0},
+             self.expected_ids(tags=['dinner'], author=self.authors[1],
+                               favorited=False)),
+        ):
+            with self.subTest(params=params):
+                self.assertTrue(expected)
+                self.assertEqual(self.walk_cursor(params, 2), expected)
+
+    def test_cursor_pages_are_stable_under_inserts(self):
+        params = {'tags': ['breakfast'], 'is_favorited': 1}
+        expected = self.expected_ids(tags=['breakfast'], favorited=True)
+        self.assertGreater(len(expected), 2)
+
+        def add_matching_recipe():
+            # Новый рецепт попадает в начало выдачи и сдвинул бы страницы
+            # пагинации по номеру.
+            recipe = Recipe.objects.create(
+                author=self.authors[0], name='new', text='text',
+                cooking_time=10, image='recipe/images/test.png',
+            )
+            RecipeTag.objects.create(recipe=recipe, tag=self.tags[0])
+            Favorite.objects.create(user=self.user, recipe=recipe)
+
+        self.assertEqual(
+            self.walk_cursor(params, 1, on_page=add_matching_recipe), expected
+        )
+
+    def test_default_page_size(self):
+        page_size = settings.PAGE_SIZE
+        self.assertLess(page_size, len(self.recipes))
+        for params in ({}, {'cursor': ''}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/recipes/', params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), page_size)
+
+
+@override_settings(DB_REPLICAS=[])
+class CountedRelationTests(TransactionTestCase):
+    """Избранное, список покупок и подписки: ответы и счетчики.
+
+    TransactionTestCase нужен, чтобы запросы из потоков и внешние транзакции
+    фиксировались по-настоящему.
+    """
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create(username='reader', email='r@x.com')
+        self.token = Token.objects.create(user=self.user)
+        self.author = User.objects.create(username='author', email='a@x.com')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='recipe', text='text', cooking_time=10,
+        )
+        self.toggles = (
+            (f'/api/recipes/{self.recipe.id}/favorite/',
+             self.recipe, 'favorites_count'),
+            (f'/api/recipes/{self.recipe.id}/shopping_cart/',
+             self.recipe, 'shopping_cart_count'),
+            (f'/api/users/{self.author.id}/subscribe/',
+             self.author, 'followers_count'),
+        )
+        self.missing = (
+            f'/api/recipes/{self.recipe.id + 1}/favorite/',
+            f'/api/recipes/{self.recipe.id + 1}/shopping_cart/',
+            f'/api/users/{self.author.id + 10}/subscribe/',
+        )
+
+    def get_client(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return client
+
+    def get_counter(self, instance, field):
+        instance.refresh_from_db(fields=[field])
+        return getattr(instance, field)
+
+    def race(self, method, path, threads=8):
+        """Статусы одновременных запросов из нескольких потоков"""
+        barrier = threading.Barrier(threads)
+        statuses = []
+        errors = []
+
+        def request():
+            client = self.get_client()
+            try:
+                barrier.wait()
+                statuses.append(getattr(client, method)(path).status_code)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=request) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        return sorted(statuses)
+
+    def test_toggles(self):
+        client = self.get_client()
+        for path, instance, field in self.toggles:
+            with self.subTest(path=path):
+                self.assertEqual(client.post(path).status_code, 201)
+                self.assertEqual(client.post(path).status_code, 400)
+                self.assertEqual(self.get_counter(instance, field), 1)
+                self.assertEqual(client.delete(path).status_code, 204)
+                self.assertEqual(client.delete(path).status_code, 400)
+                self.assertEqual(self.get_counter(instance, field), 0)
+
+    def test_missing_target_inside_transaction(self):
+        client = self.get_client()
+        for path in self.missing:
+            with self.subTest(path=path):
+                # Выход из блока фиксирует транзакцию: отсутствующий объект
+                # не должен обнаружиться только при фиксации.
+                with transaction.atomic():
+                    self.assertEqual(client.post(path).status_code, 404)
+                    self.assertEqual(client.delete(path).status_code, 404)
+        self.assertFalse(Favorite.objects.exists())
+        self.assertFalse(ShoppingCart.objects.exists())
+
+    def test_toggle_queries(self):
+        client = self.get_client()
+        for path, _, _ in self.toggles:
+            for method, code in (('post', 201), ('delete', 204)):
+                with self.subTest(path=path, method=method):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = getattr(client, method)(path)
+                    self.assertEqual(response.status_code, code)
+                    # Кроме проверки токена, рецептов автора в ответе на
+                    # подписку и BEGIN, который SQLite записывает в журнал
+                    # запросов.
+                    toggle_queries = [
+                        query for query in queries.captured_queries
+                        if '"authtoken_token"' not in query['sql']
+                        and not query['sql'].startswith(
+                            'SELECT "recipes_recipe"'
+                        )
+                        and query['sql'] != 'BEGIN'
+                    ]
+                    self.assertLessEqual(len(toggle_queries), 2)
+                    if connection.vendor == 'postgresql':
+                        self.assertEqual(len(toggle_queries), 1)
+
+    def test_concurrent_toggles(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest(
+                'SQLite в памяти не допускает одновременной записи из '
+                'потоков: укажите файл тестовой БД в DB_TEST_NAME'
+            )
+        for path, instance, field in self.toggles:
+            with self.subTest(path=path):
+                self.assertEqual(
+                    self.race('post', path), [201] + [400] * 7
+                )
+                self.assertEqual(self.get_counter(instance, field), 1)
+                self.assertEqual(
+                    self.race('delete', path), [204] + [400] * 7
+                )
+                self.assertEqual(self.get_counter(instance, field), 0)
+
+
+@override_settings(DB_REPLICAS=[], DATA_VERSION_CHECK_INTERVAL=60)
+class VersionedCacheTests(TestCase):
+    """Кеш ответов по версиям данных: 304 и тела без запросов к БД"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='a@x.com')
+        cls.tag = Tag.objects.create(
+            name='breakfast', slug='breakfast', color='#000000'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='recipe', text='text', cooking_time=10,
+        )
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.client = APIClient()
+
+    def test_not_modified_without_queries(self):
+        for path in ('/api/tags/', f'/api/tags/{self.tag.id}/',
+                     '/api/recipes/', f'/api/recipes/{self.recipe.id}/'):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+                with self.assertNumQueries(0):
+                    cached = self.client.get(path)
+                    not_modified = self.client.get(
+                        path, HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+                self.assertEqual(cached.status_code, 200)
+                self.assertEqual(cached.data, response.data)
+                self.assertEqual(not_modified.status_code, 304)
+
+    def test_write_changes_etag(self):
+        response = self.client.get('/api/tags/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='lunch', slug='lunch', color='#000001')
+        changed = self.client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertEqual(len(changed.data), 2)
+
+
+@override_settings(
+    DB_REPLICAS=[], DATA_VERSION_CHECK_INTERVAL=60,
+    INGREDIENT_INDEX_ENABLED=True,
+)
+class IngredientSearchTests(TestCase):
+    """Подсказки ингредиентов по индексу в памяти процесса"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Сахар', 'Сахарная пудра', 'Тростниковый сахар')
+        )
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.client = APIClient()
+
+    def test_keystrokes_do_not_query_database(self):
+        self.client.get('/api/ingredients/', {'name': 'с'})
+        with self.assertNumQueries(0):
+            for name in ('са', 'сах', 'саха', 'сахар'):
+                response = self.client.get(
+                    '/api/ingredients/', {'name': name}
+                )
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row['name'] for row in response.data],
+            ['Сахар', 'Сахарная пудра', 'Тростниковый сахар'],
+        )
+
+    def test_retrieve_ignores_name(self):
+        ingredient = Ingredient.objects.get(name='Сахар')
+        response = self.client.get(
+            f'/api/ingredients/{ingredient.id}/', {'name': 'Сах'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Сахар')
+
+
+@override_settings(DB_REPLICAS=[], DATA_VERSION_CHECK_INTERVAL=60)
+class RecipeQueryCountTests(TestCase):
+    """Число SQL-запросов списка и страницы рецепта не зависит от числа
+    рецептов, тегов и ингредиентов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reader', email='r@x.com')
+        cls.author = User.objects.create(username='author', email='a@x.com')
+        cls.tags = [
+            Tag.objects.create(name=slug, slug=slug, color=f'#00000{i}')
+            for i, slug in enumerate(('breakfast', 'lunch'))
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Сахар', 'Соль', 'Мука')
+        ]
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        versions._checked.clear()
+        self.anonymous = APIClient()
+        self.authenticated = APIClient()
+        self.authenticated.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def add_recipes(self, count):
+        recipes = [
+            Recipe.objects.create(
+                author=self.author, name=f'recipe {index}', text='text',
+                cooking_time=10, image='recipe/images/test.png',
+            )
+            for index in range(count)
+        ]
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag)
+            for recipe in recipes for tag in self.tags
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=10)
+            for recipe in recipes for ingredient in self.ingredients
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=self.user, recipe=recipe) for recipe in recipes
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=self.user, recipe=recipe) for recipe in recipes
+        )
+        bump_version(RECIPES_VERSION)
+        # Число рецептов и слаги тегов кешируются: запросы за ними входят
+        # в проверяемое число.
+        caches['default'].clear()
+        return recipes
+
+    def get(self, client, path, queries):
+        with self.assertNumQueries(queries):
+            response = client.get(path, {'limit': 100})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def list_queries(self, queries):
+        # Слаги тегов для фильтра и число рецептов; для списка без фильтров
+        # PostgreSQL сначала берет оценку числа строк из статистики.
+        return queries + 2 + (connection.vendor == 'postgresql')
+
+    def test_anonymous_list(self):
+        # Первый запрос заполняет кеш версий данных.
+        self.anonymous.get('/api/recipes/')
+        total = 0
+        for count in (1, 10):
+            total += len(self.add_recipes(count))
+            # Рецепты, их теги и ингредиенты; автор - в запросе рецептов.
+            results = self.get(
+                self.anonymous, '/api/recipes/', self.list_queries(3)
+            )['results']
+            self.assertEqual(len(results), total)
+            self.assertFalse(any(
+                recipe['is_favorited'] or recipe['is_in_shopping_cart']
+                for recipe in results
+            ))
+            self.get(self.anonymous, '/api/recipes/', 0)
+
+    def test_authenticated_list(self):
+        self.authenticated.get('/api/recipes/')
+        total = 0
+        for count in (1, 10):
+            total += len(self.add_recipes(count))
+            # Токен, рецепты с отметками, авторы с подпиской, теги,
+            # ингредиенты.
+            results = self.get(
+                self.authenticated, '/api/recipes/', self.list_queries(5)
+            )['results']
+            self.assertEqual(len(results), total)
+            self.assertTrue(all(
+                recipe['is_favorited'] and recipe['is_in_shopping_cart']
+                for recipe in results
+            ))
+            self.assertEqual(
+                {len(recipe['ingredients']) for recipe in results}, {3}
+            )
+
+    def test_anonymous_detail(self):
+        recipe, = self.add_recipes(1)
+        path = f'/api/recipes/{recipe.id}/'
+        self.anonymous.get(path)
+        bump_version(RECIPES_VERSION)
+        # Рецепт с автором, теги, ингредиенты.
+        data = self.get(self.anonymous, path, 3)
+        self.assertEqual(len(data['tags']), 2)
+        self.assertEqual(len(data['ingredients']), 3)
+        self.get(self.anonymous, path, 0)
+
+    def test_authenticated_detail(self):
+        recipe, = self.add_recipes(1)
+        path = f'/api/recipes/{recipe.id}/'
+        self.authenticated.get(path)
+        # Токен, рецепт с отметками, автор с подпиской, теги, ингредиенты;
+        # ответы пользователям не кешируются.
+        for _ in range(2):
+            data = self.get(self.authenticated, path, 5)
+            self.assertTrue(data['is_favorited'])
+            self.assertTrue(data['is_in_shopping_cart'])
+            self.assertFalse(data['author']['is_subscribed'])
+
+
+@override_settings(DB_REPLICAS=[])
+class RecipeUpdateTests(TestCase):
+    """Изменение рецепта: связи меняются только переданные и без лишних
+    запросов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='a@x.com')
+        cls.tags = [
+            Tag.objects.create(name=slug, slug=slug, color=f'#00000{i}')
+            for i, slug in enumerate(('breakfast', 'lunch', 'dinner'))
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Сахар', 'Соль', 'Мука')
+        ]
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='recipe', text='text', cooking_time=10,
+            image='recipe/images/test.png',
+        )
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=self.recipe, tag=tag) for tag in self.tags[:2]
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=self.recipe, ingredient=ingredient, amount=100
+            )
+            for ingredient in self.ingredients[:2]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.path = f'/api/recipes/{self.recipe.id}/'
+
+    def get_relations(self):
+        return (
+            set(self.recipe.recipe_tag.values_list('tag_id', flat=True)),
+            dict(self.recipe.recipe_ingredient.values_list(
+                'ingredient_id', 'amount'
+            )),
+        )
+
+    def patch(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.path, data, format='json')
+        return response, [
+            query['sql'] for query in queries.captured_queries
+            if '"recipes_recipeingredient"' in query['sql']
+            or '"recipes_recipetag"' in query['sql']
+        ]
+
+    def test_patch_without_relations_keeps_them(self):
+        relations = self.get_relations()
+        response, queries = self.patch({'name': 'new name'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'new name')
+        self.assertEqual(self.get_relations(), relations)
+        self.assertFalse(any(
+            sql.startswith(('INSERT', 'UPDATE', 'DELETE')) for sql in queries
+        ))
+
+    def test_changed_amount_is_single_bulk_update(self):
+        first, second = self.ingredients[:2]
+        response, queries = self.patch({
+            'ingredients': [
+                {'id': first.id, 'amount': 250},
+                {'id': second.id, 'amount': 100},
+            ],
+            'tags': [tag.id for tag in self.tags[:2]],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_relations(), (
+            {tag.id for tag in self.tags[:2]},
+            {first.id: 250, second.id: 100},
+        ))
+        writes = [
+            sql for sql in queries
+            if sql.startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith(
+            'UPDATE "recipes_recipeingredient"'
+        ))
+
+    def test_relations_are_replaced_by_difference(self):
+        response, queries = self.patch({
+            'ingredients': [
+                {'id': self.ingredients[1].id, 'amount': 100},
+                {'id': self.ingredients[2].id, 'amount': 5},
+            ],
+            'tags': [self.tags[1].id, self.tags[2].id],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_relations(), (
+            {self.tags[1].id, self.tags[2].id},
+            {self.ingredients[1].id: 100, self.ingredients[2].id: 5},
+        ))
+        # Удаление и добавление по одной записи каждой связи.
+        self.assertEqual(
+            sorted(sql.split(' ', 1)[0] for sql in queries
+                   if sql.startswith(('INSERT', 'UPDATE', 'DELETE'))),
+            ['DELETE', 'DELETE', 'INSERT', 'INSERT'],
+        )
+
+    def test_duplicate_ingredient_is_rejected(self):
+        relations = self.get_relations()
+        ingredient = self.ingredients[0]
+        response, _ = self.patch({
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10},
+                {'id': ingredient.id, 'amount': 20},
+            ],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredients', response.data)
+        self.assertEqual(self.get_relations(), relations)
+
+    def test_duplicate_tag_is_rejected(self):
+        response, _ = self.patch({
+            'tags': [self.tags[0].id, self.tags[0].id],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tags', response.data)
+
+
+@override_settings(DB_REPLICAS=[], DATA_VERSION_CHECK_INTERVAL=60)
+class CountPaginationTests(TestCase):
+    """Число рецептов в ответе: оценка, точный COUNT и его кеш"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create(username=f'author{i}', email=f'a{i}@x.com')
+            for i in range(2)
+        ]
+        for index in range(5):
+            Recipe.objects.create(
+                author=cls.authors[index % 2], name=f'recipe {index}',
+                text='text', cooking_time=10, image='recipe/images/test.png',
+            )
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        versions._checked.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.authors[0])
+
+    def get_count_queries(self, params):
+        """Ответ и запросы COUNT"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/', {'limit': 2, **params})
+        self.assertEqual(response.status_code, 200)
+        return response, [
+            query['sql'] for query in queries.captured_queries
+            if 'COUNT(' in query['sql']
+        ]
+
+    def get_count(self, params):
+        """count, count_is_exact и число запросов COUNT"""
+        response, queries = self.get_count_queries(params)
+        return (
+            response.data['count'], response.data['count_is_exact'],
+            len(queries),
+        )
+
+    @override_settings(APPROXIMATE_COUNT_THRESHOLD=0)
+    def test_unfiltered_list_uses_estimate(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE recipes_recipe')
+            _, is_exact, counts = self.get_count({})
+            self.assertFalse(is_exact)
+            self.assertEqual(counts, 0)
+        else:
+            # Оценки нет, считается точное число.
+            self.assertEqual(self.get_count({}), (5, True, 1))
+
+    def test_filtered_count_is_exact_and_cached(self):
+        author = self.authors[0].id
+        self.assertEqual(self.get_count({'author': author}), (3, True, 1))
+        self.assertEqual(self.get_count({'author': author}), (3, True, 0))
+        # Другие параметры - другой текст запроса и другая запись кеша.
+        other = self.authors[1].id
+        self.assertEqual(self.get_count({'author': other}), (2, True, 1))
+
+    def test_count_skips_user_flags(self):
+        response, queries = self.get_count_queries(
+            {'author': self.authors[0].id}
+        )
+        self.assertIn('is_favorited', response.data['results'][0])
+        sql, = queries
+        # Отметки избранного и списка покупок нужны строкам страницы,
+        # но не подсчету.
+        self.assertNotIn('recipes_favorite', sql)
+        self.assertNotIn('recipes_shoppingcart', sql)
+
+    def test_cached_count_depends_on_user(self):
+        recipe = Recipe.objects.filter(author=self.authors[0]).first()
+        Favorite.objects.create(user=self.authors[0], recipe=recipe)
+        self.assertEqual(self.get_count({'is_favorited': 1}), (1, True, 1))
+        self.client.force_authenticate(self.authors[1])
+        self.assertEqual(self.get_count({'is_favorited': 1}), (0, True, 1))
+
+    @override_settings(APPROXIMATE_COUNT_THRESHOLD=10 ** 9)
+    def test_small_table_gets_exact_count(self):
+        self.assertEqual(self.get_count({}), (5, True, 1))
+
+    def test_cursor_pages_do_not_count(self):
+        response, queries = self.get_count_queries({'cursor': ''})
+        self.assertEqual(queries, [])
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_new_recipe_resets_cached_count(self):
+        params = {'author': self.authors[0].id}
+        self.assertEqual(self.get_count(params), (3, True, 1))
+        with mock.patch.object(images.executor, 'submit'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Recipe.objects.create(
+                    author=self.authors[0], name='new', text='text',
+                    cooking_time=10, image='recipe/images/test.png',
+                )
+        self.assertEqual(self.get_count(params), (4, True, 1))
+        self.assertEqual(self.get_count(params), (4, True, 0))
+
+
+@override_settings(DB_REPLICAS=[])
+class CounterColumnsTests(TestCase):
+    """Счетчики на строках: ответы и админка читают их без COUNT, удаление
+    пользователя и rebuild_counters поддерживают их верными"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='a@x.com')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'recipe {index}', text='text',
+                cooking_time=10, image='recipe/images/test.png',
+            )
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.reader = User.objects.create(username='reader', email='r@x.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def request(self, method, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(path)
+        return response, [
+            query['sql'] for query in queries.captured_queries
+            if 'COUNT(' in query['sql']
+        ]
+
+    def test_subscribe_reads_recipes_count(self):
+        # Расхождение со строками показывает, что число берется из столбца.
+        User.objects.filter(pk=self.author.pk).update(recipes_count=7)
+        response, counts = self.request(
+            'post', f'/api/users/{self.author.id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['recipes_count'], 7)
+        self.assertEqual(counts, [])
+
+    def test_admin_lists_read_counters(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@x.com', password='password'
+        )
+        self.client.force_login(admin)
+        for path in ('/admin/recipes/recipe/', '/admin/users/user/'):
+            with self.subTest(path=path):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+                for query in queries.captured_queries:
+                    self.assertNotIn('"recipes_favorite"', query['sql'])
+                    self.assertNotIn('"users_follow"', query['sql'])
+
+    def test_user_deletion_releases_counters(self):
+        recipe = self.recipes[0]
+        for path in (f'/api/recipes/{recipe.id}/favorite/',
+                     f'/api/recipes/{recipe.id}/shopping_cart/',
+                     f'/api/users/{self.author.id}/subscribe/'):
+            self.assertEqual(self.client.post(path).status_code, 201)
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.shopping_cart_count,
+             self.author.followers_count),
+            (1, 1, 1),
+        )
+        self.reader.delete()
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.shopping_cart_count,
+             self.author.followers_count),
+            (0, 0, 0),
+        )
+        self.assertEqual(set(find_counter_drift().values()), {0})
+
+    def test_rebuild_counters_command(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipes[0])
+        Recipe.objects.filter(pk=self.recipes[1].pk).update(
+            shopping_cart_count=5
+        )
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', '--check', stdout=StringIO())
+        call_command('rebuild_counters', stdout=StringIO())
+        call_command('rebuild_counters', '--check', stdout=StringIO())
+        self.assertEqual(
+            list(Recipe.objects.order_by('id').values_list(
+                'favorites_count', 'shopping_cart_count'
+            )),
+            [(1, 0), (0, 0), (0, 0)],
+        )
@@ -1,4 +1,7 @@
-from api.views import IngredientsViewSet, RecipeViewSet, TagsViewSet
+from api import async_views
+from api.views import (DatabasePoolViewSet, IngredientsViewSet, RecipeViewSet,
+                       TagsViewSet)
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
@@ -6,8 +9,19 @@ v1_router = routers.DefaultRouter()
 v1_router.register('tags', TagsViewSet, basename='tags')
 v1_router.register('recipes', RecipeViewSet, basename='recipes')
 v1_router.register('ingredients', IngredientsViewSet, basename='ingredients')
+v1_router.register('db_pool', DatabasePoolViewSet, basename='db_pool')
 
+# Асинхронные представления перекрывают соответствующие адреса роутера.
+async_urlpatterns = [
+    path('tags/', async_views.tag_list),
+    path('tags/<int:pk>/', async_views.tag_detail),
+    path('ingredients/', async_views.ingredient_list),
+    path('ingredients/<int:pk>/', async_views.ingredient_detail),
+    path('recipes/<int:pk>/favorite/', async_views.favorite),
+    path('recipes/<int:pk>/shopping_cart/', async_views.shopping_cart),
+]
 
 urlpatterns = [
+    *(async_urlpatterns if settings.ASYNC_VIEWS_ENABLED else []),
     path('', include(v1_router.urls)),
 ]
@@ -1,23 +1,38 @@
+import os
+
+from api.include.cache import versioned_cache
 from api.include.filters import IngredientFilter, RecipeFilter
-from api.include.pagination import PageNumberLimitPagination
+from api.include.pagination import RecipePagination
+from api.include.renderers import (ShoppingCartCSVRenderer,
+                                   ShoppingCartJSONRenderer,
+                                   ShoppingCartTextRenderer)
 from api.permissions import IsAuthorOrReadOnly
 from api.serializers import (CreateRecipeSerializer, IngredientSerializer,
                              RecipeSerializer, TagSerializer,
                              ViewRecipeSerializer)
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
 from django_filters.rest_framework import DjangoFilterBackend
+from foodgram.db.postgresql.pool import get_pool_stats
+from foodgram.routers import ReplicaReadsMixin
+from recipes.counters import add_counted_relation, remove_counted_relation
+from recipes.ingredient_index import ingredient_index
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
+from recipes.versions import INGREDIENTS_VERSION, RECIPES_VERSION, TAGS_VERSION
 from rest_framework import mixins, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
-from users.models import User
 
 
+@method_decorator(versioned_cache(TAGS_VERSION), name='list')
+@method_decorator(versioned_cache(TAGS_VERSION), name='retrieve')
 class TagsViewSet(mixins.RetrieveModelMixin,
                   mixins.ListModelMixin,
                   GenericViewSet):
@@ -25,48 +40,96 @@ class TagsViewSet(mixins.RetrieveModelMixin,
     serializer_class = TagSerializer
 
 
-class RecipeViewSet(ModelViewSet):
+@method_decorator(versioned_cache(
+    RECIPES_VERSION,
+    timeout=settings.RECIPES_CACHE_TIMEOUT,
+    anonymous_only=True,
+), name='list')
+@method_decorator(versioned_cache(
+    RECIPES_VERSION,
+    timeout=settings.RECIPES_CACHE_TIMEOUT,
+    anonymous_only=True,
+), name='retrieve')
+class RecipeViewSet(ReplicaReadsMixin, ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = (IsAuthorOrReadOnly,)
-    pagination_class = PageNumberLimitPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            user = self.request.user
+            return queryset.defer('search_vector').with_related(
+                user
+            ).with_user_flags(user)
+        return queryset
+
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return CreateRecipeSerializer
         return RecipeSerializer
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            serializer.save(author=self.request.user)
 
     @action(
         detail=False,
         methods=['get'],
         permission_classes=(IsAuthenticated,),
+        renderer_classes=(ShoppingCartTextRenderer, ShoppingCartCSVRenderer,
+                          ShoppingCartJSONRenderer),
     )
     def download_shopping_cart(self, request):
-        print(RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=self.request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ))
+        """Отдает список покупок в формате txt, csv или json"""
         recipe_ingredients = RecipeIngredient.objects.filter(
             recipe__shopping_cart__user=self.request.user
         ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        shopping_list = ''
-        for ingredient in recipe_ingredients:
-            shopping_list += (
-                f"{ingredient['ingredient__name']} - "
-                f"{ingredient['amount']} "
-                f"{ingredient['ingredient__measurement_unit']}\n"
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        ).annotate(
+            amount=Sum('amount')
+        ).order_by(
+            'name', 'measurement_unit'
+        ).iterator(chunk_size=settings.SHOPPING_CART_CHUNK_SIZE)
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(recipe_ingredients),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{renderer.format}"'
+        )
+        return response
+
+    def toggle_recipe(self, model, exists_message, missing_message):
+        """Добавляет рецепт в список пользователя или удаляет из него"""
+        try:
+            recipe_id = int(self.kwargs['pk'])
+            if self.request.method == 'DELETE':
+                if remove_counted_relation(
+                    model, user_id=self.request.user.id, recipe_id=recipe_id
+                ):
+                    return Response(status=status.HTTP_204_NO_CONTENT)
+                return Response(
+                    {missing_message}, status=status.HTTP_400_BAD_REQUEST
+                )
+            recipe = add_counted_relation(
+                model,
+                ('name', 'image', 'image_variants_ready', 'cooking_time'),
+                user_id=self.request.user.id, recipe_id=recipe_id,
             )
-        return HttpResponse(shopping_list, content_type='text/plain')
+        except (ValueError, Recipe.DoesNotExist):
+            raise NotFound
+        if recipe is None:
+            return Response(
+                {exists_message}, status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = ViewRecipeSerializer(recipe)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(
         detail=True,
@@ -74,32 +137,11 @@ class RecipeViewSet(ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def shopping_cart(self, request, pk):
-        shopping_cart_recipe = get_object_or_404(Recipe, id=pk)
-        user = get_object_or_404(User, username=self.request.user.username)
-        if request.method == 'DELETE':
-            shopping_cart = (
-                user.shopping_cart.filter(recipe=shopping_cart_recipe).first()
-            )
-            if shopping_cart:
-                shopping_cart.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response(
-                {'Рецепт отсутствует в списке покупок'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        shopping_cart, created = ShoppingCart.objects.get_or_create(
-            user=user,
-            recipe=shopping_cart_recipe
+        return self.toggle_recipe(
+            ShoppingCart,
+            'Рецепт уже добавлен в список покупок',
+            'Рецепт отсутствует в списке покупок',
         )
-        if not created:
-            return Response(
-                {'Рецепт уже добавлен в список покупок'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        serializer = ViewRecipeSerializer(
-            shopping_cart_recipe
-        )
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(
         detail=True,
@@ -107,34 +149,43 @@ class RecipeViewSet(ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def favorite(self, request, pk):
-        favorite_recipe = get_object_or_404(Recipe, id=pk)
-        user = get_object_or_404(User, username=self.request.user.username)
-        if request.method == 'DELETE':
-            favorite = user.favorite.filter(recipe=favorite_recipe).first()
-            if favorite:
-                favorite.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response(
-                {'Рецепт отсутствует в избранном'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        favorite, created = Favorite.objects.get_or_create(
-            user=user,
-            recipe=favorite_recipe
+        return self.toggle_recipe(
+            Favorite,
+            'Рецепт уже добавлен в избранное',
+            'Рецепт отсутствует в избранном',
         )
-        if not created:
-            return Response(
-                {'Рецепт уже добавлен в избранное'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        serializer = ViewRecipeSerializer(favorite_recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class IngredientsViewSet(mixins.RetrieveModelMixin,
+@method_decorator(versioned_cache(INGREDIENTS_VERSION), name='list')
+@method_decorator(versioned_cache(INGREDIENTS_VERSION), name='retrieve')
+class IngredientsViewSet(ReplicaReadsMixin,
+                         mixins.RetrieveModelMixin,
                          mixins.ListModelMixin,
                          GenericViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name and settings.INGREDIENT_INDEX_ENABLED:
+            return Response(ingredient_index.search(
+                name, settings.INGREDIENT_SEARCH_LIMIT
+            ))
+        queryset = self.filter_queryset(self.get_queryset())
+        if name:
+            queryset = queryset[:settings.INGREDIENT_SEARCH_LIMIT]
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+
+class DatabasePoolViewSet(GenericViewSet):
+    """Статистика пулов соединений с БД процесса, обслужившего запрос"""
+    permission_classes = (IsAdminUser,)
+
+    def list(self, request):
+        return Response({
+            'pid': os.getpid(),
+            'pools': get_pool_stats(),
+        })
@@ -0,0 +1,55 @@
+from functools import partial
+
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+from foodgram.db.postgresql.pool import close_pools, get_pool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Соединения пула с тестовой БД мешают ее удалению.
+        close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL с пулом соединений процесса.
+
+    Django «закрывает» соединение в конце запроса при CONN_MAX_AGE = 0,
+    а этот бэкенд возвращает его в пул, и следующий запрос любого потока
+    получает готовое соединение без нового подключения к серверу.
+    Параметры пула задаются в settings.DATABASES[alias]['POOL'].
+    """
+
+    creation_class = DatabaseCreation
+    pool = None
+
+    def get_pool(self, conn_params):
+        if self.alias == NO_DB_ALIAS:
+            return None
+        key = (
+            self.alias,
+            conn_params.get('database'),
+            repr(sorted(conn_params.items())),
+        )
+        return get_pool(key, self.settings_dict.get('POOL', {}))
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        connection = pool.acquire(
+            partial(super().get_new_connection, conn_params)
+        )
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        self.pool = pool
+        return connection
+
+    def _close(self):
+        if self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            return self.pool.release(self.connection)
@@ -0,0 +1,261 @@
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+REUSABLE_STATUSES = (
+    extensions.TRANSACTION_STATUS_IDLE,
+    extensions.TRANSACTION_STATUS_INTRANS,
+    extensions.TRANSACTION_STATUS_INERROR,
+)
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Свободное соединение не появилось за отведенное время"""
+
+
+class ConnectionPool:
+    """Пул соединений psycopg2, общий для потоков процесса.
+
+    Соединение выдается из пула при подключении Django и возвращается в
+    пул вместо закрытия. Перед выдачей соединение, простоявшее дольше
+    health_check_interval, проверяется запросом SELECT 1, а соединения
+    старше max_lifetime или простаивающие дольше max_idle закрываются.
+    Если все max_size соединений заняты, подключение ждет до timeout.
+    """
+
+    def __init__(self, max_size, timeout, max_lifetime, max_idle,
+                 health_check_interval):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self._condition = threading.Condition()
+        self._pid = os.getpid()
+        # Свободные соединения: (соединение, время создания, время возврата).
+        self._idle = deque()
+        self._created_at = {}
+        self._in_use = 0
+        self._opening = 0
+        self._closed = False
+        self._stats = {
+            'acquired': 0,
+            'created': 0,
+            'closed_expired': 0,
+            'closed_idle': 0,
+            'closed_broken': 0,
+            'failed_checks': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+            'peak_in_use': 0,
+        }
+
+    def _reset_after_fork(self):
+        """Соединения родительского процесса нельзя использовать в
+        дочернем: забываем их, не закрывая сокеты родителя"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._created_at.clear()
+            self._in_use = self._opening = 0
+
+    def _evict_idle(self, now):
+        """Забирает из пула соединения, простоявшие дольше max_idle"""
+        stale = []
+        while self._idle and now - self._idle[0][2] > self.max_idle:
+            stale.append(self._idle.popleft()[0])
+            self._stats['closed_idle'] += 1
+        return stale
+
+    def _count(self, name):
+        with self._condition:
+            self._stats[name] += 1
+
+    def _check(self, connection, created_at, released_at, now):
+        """Проверяет свободное соединение перед выдачей"""
+        if now - created_at > self.max_lifetime:
+            self._count('closed_expired')
+            return False
+        if now - released_at < self.health_check_interval:
+            return not connection.closed
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            self._count('failed_checks')
+            return False
+        return True
+
+    def acquire(self, connect):
+        """Выдает соединение из пула или создает новое функцией connect"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            with self._condition:
+                self._reset_after_fork()
+                stale = self._evict_idle(time.monotonic())
+                while (not self._idle
+                       and self._in_use + self._opening >= self.max_size):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f'Connection pool exhausted: {self.max_size} '
+                            f'connections in use for {self.timeout}s.'
+                        )
+                    waited = True
+                    self._condition.wait(remaining)
+                if self._idle:
+                    entry = self._idle.pop()
+                    self._in_use += 1
+                else:
+                    entry = None
+                    self._opening += 1
+            for connection in stale:
+                self._discard(connection)
+            if entry is None:
+                connection = self._create(connect)
+                break
+            connection, created_at, released_at = entry
+            if self._check(
+                connection, created_at, released_at, time.monotonic()
+            ):
+                break
+            self._discard(connection, in_use=True)
+        self._record_wait(started, waited)
+        return connection
+
+    def _create(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._condition:
+                self._opening -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._opening -= 1
+            self._in_use += 1
+            self._created_at[id(connection)] = time.monotonic()
+            self._stats['created'] += 1
+        return connection
+
+    def _record_wait(self, started, waited):
+        wait_ms = (time.monotonic() - started) * 1000
+        with self._condition:
+            stats = self._stats
+            stats['acquired'] += 1
+            stats['peak_in_use'] = max(stats['peak_in_use'], self._in_use)
+            if waited:
+                stats['waits'] += 1
+                stats['wait_ms_total'] += wait_ms
+                stats['wait_ms_max'] = max(stats['wait_ms_max'], wait_ms)
+
+    def _discard(self, connection, in_use=False):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self._condition:
+            self._created_at.pop(id(connection), None)
+            if in_use:
+                self._in_use -= 1
+            self._condition.notify()
+
+    def release(self, connection):
+        """Возвращает соединение в пул, откатив незавершенную транзакцию"""
+        reusable = (
+            not connection.closed
+            and connection.get_transaction_status() in REUSABLE_STATUSES
+        )
+        if reusable and (connection.get_transaction_status()
+                         != extensions.TRANSACTION_STATUS_IDLE):
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                reusable = False
+        now = time.monotonic()
+        with self._condition:
+            if self._pid != os.getpid():
+                return
+            created_at = self._created_at.get(id(connection), now)
+            if self._closed or not reusable:
+                self._stats['closed_broken'] += not reusable
+            elif now - created_at > self.max_lifetime:
+                self._stats['closed_expired'] += 1
+            else:
+                self._idle.append((connection, created_at, now))
+                self._in_use -= 1
+                self._condition.notify()
+                return
+        self._discard(connection, in_use=True)
+
+    def close(self):
+        """Закрывает свободные соединения; занятые закроются при возврате"""
+        with self._condition:
+            self._closed = True
+            idle = [entry[0] for entry in self._idle]
+            self._idle.clear()
+        for connection in idle:
+            self._discard(connection)
+
+    def get_stats(self):
+        with self._condition:
+            in_use, idle = self._in_use, len(self._idle)
+            stats = dict(self._stats)
+        stats['wait_ms_total'] = round(stats['wait_ms_total'], 3)
+        stats['wait_ms_max'] = round(stats['wait_ms_max'], 3)
+        return {
+            'max_size': self.max_size,
+            'in_use': in_use,
+            'idle': idle,
+            **stats,
+        }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, options):
+    """Пул процесса для набора параметров подключения"""
+    with _pools_lock:
+        if key not in _pools or _pools[key]._closed:
+            _pools[key] = ConnectionPool(
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 10),
+                max_lifetime=options.get('MAX_LIFETIME', 3600),
+                max_idle=options.get('MAX_IDLE', 300),
+                health_check_interval=options.get(
+                    'HEALTH_CHECK_INTERVAL', 5
+                ),
+            )
+        return _pools[key]
+
+
+def close_pools(alias=None):
+    """Закрывает пулы соединения alias или все пулы процесса"""
+    with _pools_lock:
+        keys = [key for key in _pools if alias is None or key[0] == alias]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
+
+
+def get_pool_stats():
+    """Статистика пулов процесса по псевдонимам и базам данных"""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {
+        f'{alias}:{database}': pool.get_stats()
+        for (alias, database, _), pool in pools
+    }
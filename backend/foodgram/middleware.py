@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import re
+from collections import Counter
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.deprecation import MiddlewareMixin
+from foodgram.routers import SAFE_METHODS, pin_to_primary
+
+logger = logging.getLogger('foodgram.requests')
+
+IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+current_collector = ContextVar('sql_collector', default=None)
+
+
+def fingerprint(sql):
+    """Форма запроса без значений: одинакова для запросов N+1"""
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return LITERAL_RE.sub('?', sql)
+
+
+class QueryCollector:
+    """Обертка выполнения SQL, собирающая время и формы запросов"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    @property
+    def count(self):
+        return sum(self.fingerprints.values())
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += perf_counter() - started
+            self.fingerprints[fingerprint(sql)] += 1
+
+
+def collect_queries(execute, sql, params, many, context):
+    """Передает запрос сборщику текущего HTTP-запроса, если он есть.
+
+    Сборщик хранится в переменной контекста, которую asgiref копирует в
+    потоки sync_to_async, поэтому учитываются и запросы асинхронных
+    представлений из пула потоков.
+    """
+    collector = current_collector.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    return collector(execute, sql, params, many, context)
+
+
+def install_query_collector(connection, **kwargs):
+    if collect_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(collect_queries)
+
+
+class QueryInstrumentationMiddleware:
+    """Считает SQL-запросы и время каждого запроса к API.
+
+    Добавляет заголовок Server-Timing, предупреждает о повторяющихся
+    формах запросов (N+1) и пишет медленные запросы в журнал
+    foodgram.requests. Включается настройкой SQL_INSTRUMENTATION_ENABLED.
+    Работает и под WSGI, и под ASGI без переключения потоков.
+    Запросы, выполняемые при отдаче потокового ответа, не учитываются.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SQL_INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        connection_created.connect(install_query_collector)
+        for connection in connections.all():
+            install_query_collector(connection)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        collector = QueryCollector()
+        token = current_collector.set(collector)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_collector.reset(token)
+        return self.process_response(request, response, collector, started)
+
+    async def __acall__(self, request):
+        collector = QueryCollector()
+        token = current_collector.set(collector)
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_collector.reset(token)
+        return self.process_response(request, response, collector, started)
+
+    def process_response(self, request, response, collector, started):
+        total_ms = (perf_counter() - started) * 1000
+        sql_ms = collector.seconds * 1000
+        response['Server-Timing'] = (
+            f'sql;dur={sql_ms:.1f};desc="{collector.count} queries", '
+            f'total;dur={total_ms:.1f}'
+        )
+        repeated = any(
+            count >= settings.SQL_REPEATED_QUERY_THRESHOLD
+            for count in collector.fingerprints.values()
+        )
+        if total_ms >= settings.SLOW_REQUEST_THRESHOLD_MS:
+            event = 'slow_request'
+        elif repeated:
+            event = 'repeated_queries'
+        else:
+            return response
+        self.log(event, request, response, collector, total_ms, sql_ms)
+        return response
+
+    def log(self, event, request, response, collector, total_ms, sql_ms):
+        match = request.resolver_match
+        logger.warning(json.dumps({
+            'event': event,
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'sql_ms': round(sql_ms, 1),
+            'queries': collector.count,
+            'top_queries': [
+                {'sql': sql, 'count': count}
+                for sql, count in collector.fingerprints.most_common(
+                    settings.SQL_INSTRUMENTATION_TOP_QUERIES
+                )
+            ],
+        }, ensure_ascii=False))
+
+
+class PrimaryPinMiddleware(MiddlewareMixin):
+    """После успешного запроса на запись привязывает клиента к основной БД,
+    чтобы следующие чтения не попали на отстающую реплику.
+
+    Привязка хранится в кеше API, поэтому при нескольких процессах нужен
+    общий бэкенд кеша (API_CACHE_BACKEND). Без реплик не подключается.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DB_REPLICAS:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_response(self, request, response):
+        if (request.method not in SAFE_METHODS
+                and response.status_code < 400):
+            pin_to_primary(request)
+        return response
@@ -0,0 +1,93 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import caches
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Токен читается до того, как клиент успеет сделать запрос на запись,
+# поэтому сразу после входа он может еще не дойти до реплики.
+PRIMARY_ONLY_MODELS = ('authtoken.token', 'recipes.dataversion')
+
+_replica = ContextVar('replica', default=None)
+_primary = ContextVar('primary', default=False)
+
+
+def get_pin_key(request):
+    """Ключ привязки клиента к основной БД по заголовку авторизации"""
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return f'primary:{sha256(authorization.encode()).hexdigest()}'
+
+
+def pin_to_primary(request):
+    """Направляет чтения клиента в основную БД на
+    REPLICA_STICKINESS_SECONDS, чтобы он сразу видел свои изменения"""
+    key = get_pin_key(request)
+    if key is not None:
+        caches[settings.API_CACHE_ALIAS].set(
+            key, True, settings.REPLICA_STICKINESS_SECONDS
+        )
+
+
+def is_pinned(request):
+    key = get_pin_key(request)
+    return key is not None and caches[settings.API_CACHE_ALIAS].get(key, False)
+
+
+@contextmanager
+def replica_reads(request):
+    """Разрешает читать с одной из реплик на время безопасного запроса
+    клиента, не привязанного к основной БД"""
+    replica = None
+    if (settings.DB_REPLICAS and request.method in SAFE_METHODS
+            and not is_pinned(request)):
+        replica = random.choice(settings.DB_REPLICAS)
+    token = _replica.set(replica)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Направляет все чтения в основную БД, в том числе внутри
+    replica_reads: так собираются ответы, которые попадут в общий кеш"""
+    token = _primary.set(True)
+    try:
+        yield
+    finally:
+        _primary.reset(token)
+
+
+class ReplicaReadsMixin:
+    """Чтение с реплик для безопасных запросов к представлению"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(request):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class ReplicaRouter:
+    """Отправляет чтения внутри replica_reads на реплику, остальные
+    запросы и все записи — в основную БД"""
+
+    def db_for_read(self, model, **hints):
+        if _primary.get() or model._meta.label_lower in PRIMARY_ONLY_MODELS:
+            return None
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DB_REPLICAS:
+            return False
+        return None
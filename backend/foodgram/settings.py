@@ -34,6 +34,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -41,6 +42,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'foodgram.middleware.PrimaryPinMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -74,10 +76,51 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres123'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', default=0)),
+        # Тестовая БД SQLite по умолчанию в памяти; с файлом в нее можно
+        # писать из нескольких потоков.
+        'TEST': {'NAME': os.getenv('DB_TEST_NAME')},
+        # Нужно для пулеров в режиме транзакций (PgBouncer pool_mode=transaction).
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.getenv('DB_DISABLE_SERVER_SIDE_CURSORS', default='False') == 'True'
+        ),
+        # Используется бэкендом foodgram.db.postgresql.
+        'POOL': {
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', default=4)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=10)),
+            'MAX_LIFETIME': int(os.getenv('DB_POOL_MAX_LIFETIME', default=3600)),
+            'MAX_IDLE': int(os.getenv('DB_POOL_MAX_IDLE', default=300)),
+            'HEALTH_CHECK_INTERVAL': float(
+                os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', default=5)
+            ),
+        },
     }
 }
 
+# Реплики только для чтения: DB_REPLICA_HOSTS=host1,host2:5433
+DB_REPLICA_HOSTS = [
+    host.strip()
+    for host in os.getenv('DB_REPLICA_HOSTS', default='').split(',')
+    if host.strip()
+]
+DB_REPLICAS = [
+    f'replica_{index}' for index in range(1, len(DB_REPLICA_HOSTS) + 1)
+]
+for alias, replica_host in zip(DB_REPLICAS, DB_REPLICA_HOSTS):
+    host, _, port = replica_host.partition(':')
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['foodgram.routers.ReplicaRouter']
+REPLICA_STICKINESS_SECONDS = int(
+    os.getenv('REPLICA_STICKINESS_SECONDS', default=10)
+)
+
 
 # Password validation
 
@@ -127,10 +170,13 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
 }
 
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', default=60))
+
 # Default primary key field type
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -140,3 +186,121 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 RECIPES_LIMIT = 1
 MIN_VALUE = 1
 MAX_VALUE = 32000
+SHOPPING_CART_CHUNK_SIZE = 2000
+
+# Ingredient autocomplete
+
+INGREDIENT_INDEX_ENABLED = (
+    os.getenv('INGREDIENT_INDEX_ENABLED', default='True') == 'True'
+)
+INGREDIENT_SEARCH_LIMIT = 50
+
+# Recipe images
+
+MAX_IMAGE_UPLOAD_SIZE = int(
+    os.getenv('MAX_IMAGE_UPLOAD_SIZE', default=5 * 1024 * 1024)
+)
+BASE64_DECODE_CHUNK_SIZE = 64 * 1024
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (480, 480),
+    'detail': (1200, 1200),
+}
+RECIPE_IMAGE_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', default=2))
+
+# Pagination
+
+# Размер страницы без параметра limit: по номеру страницы и по курсору.
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', default=6))
+
+APPROXIMATE_COUNT_THRESHOLD = int(
+    os.getenv('APPROXIMATE_COUNT_THRESHOLD', default=100000)
+)
+COUNT_CACHE_TIMEOUT = int(os.getenv('COUNT_CACHE_TIMEOUT', default=10))
+
+# Response cache
+
+API_CACHE_ALIAS = 'api'
+API_CACHE_BACKEND = os.getenv(
+    'API_CACHE_BACKEND',
+    default='django.core.cache.backends.locmem.LocMemCache'
+)
+API_CACHE = {
+    'BACKEND': API_CACHE_BACKEND,
+    'LOCATION': os.getenv('API_CACHE_LOCATION', default='api'),
+}
+# Общий для процессов кеш API: Redis, Memcached, файловый.
+API_CACHE_SHARED = os.getenv(
+    'API_CACHE_SHARED',
+    default=str(not API_CACHE_BACKEND.endswith('LocMemCache')),
+) == 'True'
+if API_CACHE_BACKEND.endswith('LocMemCache'):
+    API_CACHE['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('API_CACHE_MAX_ENTRIES', default=1000)),
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    API_CACHE_ALIAS: API_CACHE,
+}
+
+# Кеш токенов проверяет отзыв токенов по меткам в кеше API, поэтому по
+# умолчанию включается только с общим для процессов кешем API.
+TOKEN_CACHE_ENABLED = os.getenv(
+    'TOKEN_CACHE_ENABLED', default=str(API_CACHE_SHARED)
+) == 'True'
+
+# Версии данных для ETag и кешей процесс перечитывает не чаще, чем раз в
+# столько секунд.
+DATA_VERSION_CHECK_INTERVAL = float(
+    os.getenv('DATA_VERSION_CHECK_INTERVAL', default=1)
+)
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+RECIPES_CACHE_TIMEOUT = int(os.getenv('RECIPES_CACHE_TIMEOUT', default=300))
+
+# Recipe search
+
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', default='russian')
+
+# Async views
+
+ASYNC_VIEWS_ENABLED = (
+    os.getenv('ASYNC_VIEWS_ENABLED', default='False') == 'True'
+)
+ASYNC_DB_THREADS = int(os.getenv('ASYNC_DB_THREADS', default=8))
+
+# SQL instrumentation
+
+SQL_INSTRUMENTATION_ENABLED = (
+    os.getenv('SQL_INSTRUMENTATION_ENABLED', default='False') == 'True'
+)
+SLOW_REQUEST_THRESHOLD_MS = int(
+    os.getenv('SLOW_REQUEST_THRESHOLD_MS', default=500)
+)
+SQL_REPEATED_QUERY_THRESHOLD = int(
+    os.getenv('SQL_REPEATED_QUERY_THRESHOLD', default=10)
+)
+SQL_INSTRUMENTATION_TOP_QUERIES = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,198 @@
+import asyncio
+import re
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from foodgram.middleware import (QueryInstrumentationMiddleware,
+                                 install_query_collector)
+from foodgram.routers import ReplicaRouter
+from PIL import Image
+from recipes import images
+from recipes.models import Recipe, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+
+@skipUnless(
+    settings.DB_REPLICAS,
+    'Запуск с репликой: DB_REPLICA_HOSTS=replica python manage.py test',
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Чтение с реплики и основной БД по двум псевдонимам.
+
+    Реплика в тестах - зеркало тестовой БД (TEST MIRROR), поэтому проверяется
+    только, через какое соединение идут запросы. TransactionTestCase нужен,
+    чтобы соединение реплики видело данные теста.
+    """
+    databases = {'default', *settings.DB_REPLICAS}
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        # Копии изображений создаются сразу, до удаления временного каталога.
+        inline = mock.patch.object(
+            images.executor, 'submit', lambda function, *args: function(*args)
+        )
+        inline.start()
+        self.addCleanup(inline.stop)
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.replica = settings.DB_REPLICAS[0]
+        image = BytesIO()
+        Image.new('RGB', (4, 4)).save(image, 'PNG')
+        default_storage.save('recipe/images/test.png', ContentFile(
+            image.getvalue()
+        ))
+        self.author = User.objects.create(username='author', email='a@x.com')
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name='recipe',
+            text='text',
+            cooking_time=10,
+            image='recipe/images/test.png',
+        )
+        self.reader = User.objects.create(username='reader', email='r@x.com')
+
+    def get_client(self, user=None):
+        client = APIClient()
+        if user is not None:
+            token = Token.objects.create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def request(self, client, method, path):
+        """Ответ и SQL-запросы к основной БД и к реплике"""
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections[self.replica]) as replica:
+                response = getattr(client, method)(path)
+        return response, [
+            query['sql'] for query in primary.captured_queries
+        ], [query['sql'] for query in replica.captured_queries]
+
+    def test_safe_request_reads_from_replica(self):
+        client = self.get_client(self.reader)
+        response, primary, replica = self.request(
+            client, 'get', f'/api/recipes/{self.recipe.id}/'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('"recipes_recipe"' in sql for sql in replica))
+        self.assertFalse(any('"recipes_recipe"' in sql for sql in primary))
+        # Токены читаются только из основной БД.
+        self.assertTrue(any('"authtoken_token"' in sql for sql in primary))
+        self.assertFalse(any('"authtoken_token"' in sql for sql in replica))
+
+    def test_write_pins_client_to_primary(self):
+        client = self.get_client(self.reader)
+        path = f'/api/recipes/{self.recipe.id}/'
+        response, _, replica = self.request(client, 'post', f'{path}favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(replica, [])
+        response, primary, replica = self.request(client, 'get', path)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertEqual(replica, [])
+        self.assertTrue(any('"recipes_recipe"' in sql for sql in primary))
+        other = self.get_client(self.author)
+        _, _, replica = self.request(other, 'get', path)
+        self.assertTrue(replica)
+
+    def test_versioned_cache_is_filled_from_primary(self):
+        client = self.get_client()
+        path = f'/api/recipes/{self.recipe.id}/'
+        response, primary, replica = self.request(client, 'get', path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, [])
+        self.assertTrue(any('"recipes_recipe"' in sql for sql in primary))
+        response, primary, replica = self.request(client, 'get', path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, [])
+        self.assertFalse(any('"recipes_recipe"' in sql for sql in primary))
+
+    def test_no_migrations_on_replica(self):
+        router = ReplicaRouter()
+        self.assertIs(router.allow_migrate(self.replica, 'recipes'), False)
+        self.assertIsNone(router.allow_migrate('default', 'recipes'))
+
+
+def select_one():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+async def async_view(request):
+    # Новые потоки пула цикла событий: соединения пула ASYNC_DB_THREADS
+    # могли открыться в других тестах раньше, чем подключен middleware.
+    for _ in range(2):
+        await sync_to_async(select_one, thread_sensitive=False)()
+    return HttpResponse()
+
+
+@override_settings(SQL_INSTRUMENTATION_ENABLED=True, DB_REPLICAS=[])
+class QueryInstrumentationTests(TestCase):
+    """Заголовок Server-Timing под WSGI и ASGI"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='a@x.com')
+        cls.tag = Tag.objects.create(
+            name='breakfast', slug='breakfast', color='#000000'
+        )
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+
+    def get_query_count(self, response):
+        match = re.search(r'desc="(\d+) queries"', response['Server-Timing'])
+        self.assertIsNotNone(match)
+        return int(match.group(1))
+
+    def test_sync_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.get_query_count(response), len(queries.captured_queries)
+        )
+        self.assertTrue(queries.captured_queries)
+
+    def test_asgi_request(self):
+        # Обработчик ASGI создается в потоке цикла событий, а соединение
+        # основного потока открыто раньше, поэтому сигнал о нем не придет.
+        install_query_collector(connection)
+
+        async def get():
+            return await self.async_client.get('/api/tags/')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = async_to_sync(get)()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.get_query_count(response), len(queries.captured_queries)
+        )
+        self.assertTrue(queries.captured_queries)
+
+    def test_queries_in_executor_threads(self):
+        middleware = QueryInstrumentationMiddleware(async_view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        request = RequestFactory().get('/')
+
+        async def call():
+            return await middleware(request)
+
+        response = async_to_sync(call)()
+        self.assertEqual(self.get_query_count(response), 2)
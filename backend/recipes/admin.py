@@ -16,6 +16,14 @@ class RecipeTagInline(admin.TabularInline):
 
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientInline, RecipeTagInline)
+    list_display = (
+        'id',
+        'name',
+        'author',
+        'favorites_count',
+        'shopping_cart_count',
+    )
+    list_select_related = ('author',)
 
 
 admin.site.register(Ingredient)
@@ -0,0 +1,21 @@
+import csv
+import io
+
+
+class CSVStream:
+    """Файлоподобный поток строк CSV для COPY FROM STDIN"""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator='\n')
+
+    def read(self, size=-1):
+        while size < 0 or self.buffer.tell() < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+        buffer, self.buffer = self.buffer, io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator='\n')
+        return buffer.getvalue()
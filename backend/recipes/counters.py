@@ -0,0 +1,198 @@
+from django.db import connections, router, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    """Изменяет счетчик одним UPDATE, не опуская его ниже нуля"""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def get_counter(related_model):
+    """Модель, поле счетчика и поле связи для связей related_model"""
+    for model, field, counted_model, related_field in COUNTERS:
+        if counted_model is related_model:
+            return model, field, related_field
+    raise LookupError(f'{related_model._meta.label} is not counted')
+
+
+def get_column(model, name):
+    return model._meta.get_field(name).column
+
+
+def can_return_rows(connection):
+    """Поддерживает ли БД RETURNING в INSERT, UPDATE и DELETE"""
+    return connection.vendor == 'postgresql' or (
+        connection.vendor == 'sqlite'
+        and connection.Database.sqlite_version_info >= (3, 35)
+    )
+
+
+def add_counted_relation(model, fields, **values):
+    """Создает связь и увеличивает ее счетчик.
+
+    values - значения внешних ключей связи (user_id, recipe_id и т.п.).
+    Вставка пропускает конфликт уникального ограничения, поэтому
+    одновременные запросы не падают с IntegrityError. Возвращает объект
+    счетчика с полями fields или None, если такая связь уже есть. Если
+    связываемого объекта нет, поднимает DoesNotExist его модели.
+    На PostgreSQL вставка и изменение счетчика выполняются одним запросом,
+    на SQLite - двумя.
+    """
+    counter_model, field, related_field = get_counter(model)
+    related_attname = model._meta.get_field(related_field).attname
+    pk = values[related_attname]
+    using = router.db_for_write(model)
+    connection = connections[using]
+    columns = ', '.join(get_column(model, name) for name in values)
+    placeholders = ', '.join(['%s'] * len(values))
+    pk_column = counter_model._meta.pk.column
+    # Внешние ключи проверяются только при фиксации транзакции, а внутри
+    # внешней транзакции ошибка всплыла бы уже после ответа. Поэтому строка
+    # вставляется, только если связываемый объект есть. На PostgreSQL
+    # блокировка не дает удалить объект до конца транзакции.
+    lock = ' FOR KEY SHARE' if connection.vendor == 'postgresql' else ''
+    insert_sql = (
+        f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+        f'{model._meta.db_table} ({columns}) SELECT {placeholders} '
+        f'WHERE EXISTS (SELECT 1 FROM {counter_model._meta.db_table} '
+        f'WHERE {pk_column} = %s{lock}) '
+        f'{connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    )
+    params = [*values.values(), pk]
+    returning = ', '.join(get_column(counter_model, name) for name in fields)
+    update_sql = (
+        f'UPDATE {counter_model._meta.db_table} '
+        f'SET {field} = {field} + 1 WHERE {pk_column} IN ({{}}) '
+        f'RETURNING {pk_column}, {returning}'
+    )
+    counter = None
+    # Единственный запрос не требует точки сохранения во внешней транзакции.
+    with transaction.atomic(using=using, savepoint=False):
+        if connection.vendor == 'postgresql':
+            related_column = get_column(model, related_attname)
+            counter = next(iter(counter_model.objects.raw(
+                f'WITH inserted AS ({insert_sql} '
+                f'RETURNING {related_column}) '
+                + update_sql.format(f'SELECT {related_column} FROM inserted'),
+                params,
+                using=using,
+            )), None)
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(insert_sql, params)
+                inserted = cursor.rowcount
+            if inserted and can_return_rows(connection):
+                counter = next(iter(counter_model.objects.raw(
+                    update_sql.format('%s'), [pk], using=using
+                )))
+            elif inserted:
+                change_counter(counter_model, pk, field, 1)
+                counter = counter_model.objects.using(using).only(
+                    *fields
+                ).get(pk=pk)
+    if counter is not None:
+        return counter
+    if not counter_model.objects.using(using).filter(pk=pk).exists():
+        raise counter_model.DoesNotExist(
+            f'{counter_model._meta.object_name} {pk} does not exist'
+        )
+    return None
+
+
+def remove_counted_relation(model, **values):
+    """Удаляет связь и уменьшает ее счетчик.
+
+    Возвращает False, если такой связи нет, и поднимает DoesNotExist
+    модели счетчика, если нет связываемого объекта. На PostgreSQL
+    удаление и изменение счетчика выполняются одним запросом, на
+    остальных БД - двумя.
+    """
+    counter_model, field, related_field = get_counter(model)
+    related_attname = model._meta.get_field(related_field).attname
+    pk = values[related_attname]
+    using = router.db_for_write(model)
+    connection = connections[using]
+    conditions = ' AND '.join(
+        f'{get_column(model, name)} = %s' for name in values
+    )
+    delete_sql = f'DELETE FROM {model._meta.db_table} WHERE {conditions}'
+    with transaction.atomic(using=using, savepoint=False):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                related_column = get_column(model, related_attname)
+                pk_column = counter_model._meta.pk.column
+                cursor.execute(
+                    f'WITH deleted AS ({delete_sql} '
+                    f'RETURNING {related_column}) '
+                    f'UPDATE {counter_model._meta.db_table} '
+                    f'SET {field} = GREATEST({field} - 1, 0) '
+                    f'WHERE {pk_column} IN '
+                    f'(SELECT {related_column} FROM deleted)',
+                    list(values.values()),
+                )
+                deleted = cursor.rowcount
+            else:
+                cursor.execute(delete_sql, list(values.values()))
+                deleted = cursor.rowcount
+                if deleted:
+                    change_counter(counter_model, pk, field, -1)
+    if deleted:
+        return True
+    if not counter_model.objects.using(using).filter(pk=pk).exists():
+        raise counter_model.DoesNotExist(
+            f'{counter_model._meta.object_name} {pk} does not exist'
+        )
+    return False
+
+
+def release_user_counters(user):
+    """Уменьшает счетчики рецептов и авторов, связи с которыми удаляются
+    каскадно вместе с пользователем"""
+    for model in (Favorite, ShoppingCart, Follow):
+        counter_model, field, related_field = get_counter(model)
+        counter_model.objects.filter(
+            pk__in=model.objects.filter(user=user).values(related_field)
+        ).update(**{field: Greatest(F(field) - 1, 0)})
+
+
+def count_subquery(related_model, related_field):
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(
+            related_field
+        ).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def find_counter_drift():
+    """Число строк, у которых счетчик расходится с фактическим значением"""
+    return {
+        f'{model._meta.label}.{field}': model.objects.annotate(
+            actual=count_subquery(related_model, related_field)
+        ).exclude(**{field: F('actual')}).count()
+        for model, field, related_model, related_field in COUNTERS
+    }
+
+
+def rebuild_counters():
+    """Пересчитывает все счетчики по связанным таблицам"""
+    return {
+        f'{model._meta.label}.{field}': model.objects.update(
+            **{field: count_subquery(related_model, related_field)}
+        )
+        for model, field, related_model, related_field in COUNTERS
+    }
@@ -0,0 +1,118 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image
+from recipes.models import Recipe
+from recipes.versions import RECIPES_VERSION, bump_version_on_commit
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_VARIANT_WORKERS,
+    thread_name_prefix='image-variants',
+)
+
+
+def get_image_formats():
+    """Возвращает форматы вариантов, которые умеет сохранять Pillow"""
+    Image.init()
+    return {
+        extension: image_format
+        for extension, image_format in settings.RECIPE_IMAGE_FORMATS.items()
+        if image_format in Image.SAVE
+    }
+
+
+def variant_name(name, variant, extension):
+    root, _ = os.path.splitext(name)
+    return f'{root}_{variant}.{extension}'
+
+
+def variant_urls(name, ready):
+    """Ссылки на уменьшенные копии изображения по размерам и форматам.
+
+    ready - отметка рецепта о том, что копии созданы. Пока копий нет, все
+    ссылки ведут на исходное изображение. Хранилище при этом не
+    опрашивается.
+    """
+    return {
+        variant: {
+            extension: default_storage.url(
+                variant_name(name, variant, extension) if ready else name
+            )
+            for extension in get_image_formats()
+        }
+        for variant in settings.RECIPE_IMAGE_VARIANTS
+    }
+
+
+def generate_variants(name):
+    """Создает уменьшенные копии изображения во всех форматах"""
+    formats = get_image_formats()
+    with default_storage.open(name) as source, Image.open(source) as image:
+        image.load()
+        for variant, size in settings.RECIPE_IMAGE_VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(size)
+            if resized.mode not in ('RGB', 'RGBA'):
+                resized = resized.convert('RGBA')
+            for extension, image_format in formats.items():
+                output = resized
+                if image_format == 'JPEG':
+                    output = resized.convert('RGB')
+                buffer = BytesIO()
+                output.save(buffer, image_format)
+                target = variant_name(name, variant, extension)
+                default_storage.delete(target)
+                default_storage.save(target, ContentFile(buffer.getvalue()))
+
+
+def mark_variants_ready(name):
+    """Отмечает копии созданными у рецептов с этим изображением и
+    сбрасывает кеш ответов по рецептам"""
+    if Recipe.objects.filter(
+        image=name, image_variants_ready=False
+    ).update(image_variants_ready=True):
+        bump_version_on_commit(RECIPES_VERSION)
+
+
+def run_generate_variants(name):
+    try:
+        generate_variants(name)
+        mark_variants_ready(name)
+    except Exception:
+        logger.exception('Не удалось создать копии изображения %s', name)
+    finally:
+        # Поток пула не обслуживает запросы, поэтому соединения с БД
+        # закрываются здесь, как после запроса.
+        close_old_connections()
+
+
+def delete_variants(name):
+    """Удаляет уменьшенные копии изображения"""
+    for variant in settings.RECIPE_IMAGE_VARIANTS:
+        for extension in settings.RECIPE_IMAGE_FORMATS:
+            default_storage.delete(variant_name(name, variant, extension))
+
+
+def run_delete_variants(name):
+    try:
+        delete_variants(name)
+    except Exception:
+        logger.exception('Не удалось удалить копии изображения %s', name)
+
+
+def schedule_variants(name):
+    """Ставит создание копий в пул потоков после фиксации транзакции"""
+    transaction.on_commit(lambda: executor.submit(run_generate_variants, name))
+
+
+def schedule_delete_variants(name):
+    """Ставит удаление копий в пул потоков после фиксации транзакции"""
+    transaction.on_commit(lambda: executor.submit(run_delete_variants, name))
@@ -0,0 +1,60 @@
+import threading
+from bisect import bisect_left
+
+from foodgram.routers import primary_reads
+from recipes.models import Ingredient
+from recipes.versions import INGREDIENTS_VERSION, get_version
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Названия приводятся к нижнему регистру и хранятся отсортированными,
+    поэтому поиск по префиксу — это бинарный поиск без обращения к БД.
+    Индекс перестраивается при смене версии ингредиентов, а версию процесс
+    перечитывает не чаще раза в DATA_VERSION_CHECK_INTERVAL секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = (None, [], [])
+
+    def _build(self, version):
+        # Индекс живет до смены версии, поэтому читается из основной БД,
+        # а не с реплики, которая может отставать.
+        with primary_reads():
+            rows = sorted(
+                Ingredient.objects.values('id', 'name', 'measurement_unit'),
+                key=lambda row: (row['name'].casefold(), row['id'])
+            )
+        keys = [row['name'].casefold() for row in rows]
+        self._snapshot = (version, keys, rows)
+
+    def _get_snapshot(self):
+        version = get_version(INGREDIENTS_VERSION)
+        if self._snapshot[0] != version:
+            with self._lock:
+                if self._snapshot[0] != version:
+                    self._build(version)
+        return self._snapshot
+
+    def search(self, query, limit):
+        """Ищет ингредиенты: сначала совпадения по префиксу, затем по
+        вхождению подстроки"""
+        _, keys, rows = self._get_snapshot()
+        query = query.casefold()
+        results = []
+        position = bisect_left(keys, query)
+        while (len(results) < limit and position < len(keys)
+               and keys[position].startswith(query)):
+            results.append(rows[position])
+            position += 1
+        for key, row in zip(keys, rows):
+            if len(results) >= limit:
+                break
+            if query in key and not key.startswith(query):
+                results.append(row)
+        return results
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,95 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from recipes.models import (Favorite, Recipe, RecipeIngredient, RecipeTag,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Run EXPLAIN on the queries behind the main API endpoints and '
+        'report sequential scans. Run it against a seeded database.'
+    )
+
+    def get_queries(self):
+        user = User.objects.filter(shopping_cart__isnull=False).first()
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True)[:6])
+        if user is None or not recipe_ids:
+            raise CommandError('Seed the database first.')
+        author_ids = list(Recipe.objects.filter(
+            id__in=recipe_ids
+        ).values_list('author', flat=True))
+        tag_slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        return {
+            'download_shopping_cart': RecipeIngredient.objects.filter(
+                recipe__shopping_cart__user=user
+            ).values(
+                name=F('ingredient__name'),
+                measurement_unit=F('ingredient__measurement_unit'),
+            ).annotate(amount=Sum('amount')),
+            'recipe_ingredients': RecipeIngredient.objects.filter(
+                recipe__in=recipe_ids
+            ).select_related('ingredient').order_by(),
+            'recipe_tags': RecipeTag.objects.filter(
+                recipe__in=recipe_ids
+            ).select_related('tag').order_by(),
+            'tags_filter': RecipeTag.objects.filter(
+                recipe=recipe_ids[0], tag__slug__in=tag_slugs
+            ).order_by(),
+            'is_favorited': Favorite.objects.filter(
+                user=user, recipe__in=recipe_ids
+            ).order_by(),
+            'is_in_shopping_cart': ShoppingCart.objects.filter(
+                user=user, recipe__in=recipe_ids
+            ).order_by(),
+            'is_subscribed': Follow.objects.filter(
+                user=user, following__in=author_ids
+            ).order_by(),
+            'subscriptions': User.objects.filter(following__user=user),
+            'followers': Follow.objects.filter(following=user).order_by(),
+            'author_recipes': Recipe.objects.filter(
+                author=author_ids[0]
+            ).order_by('-id')[:6],
+            'recipe_favorites': Favorite.objects.filter(
+                recipe=recipe_ids[0]
+            ).order_by(),
+        }
+
+    def explain(self, queryset):
+        if connection.vendor != 'postgresql':
+            return queryset.explain()
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Без последовательного чтения планировщик возьмет индекс везде,
+            # где он подходит, независимо от размера таблицы.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+
+    def handle(self, *args, **kwargs):
+        pattern = SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(
+                f'EXPLAIN parsing is not supported for {connection.vendor}.'
+            )
+        regressions = {}
+        for name, queryset in self.get_queries().items():
+            plan = self.explain(queryset)
+            scans = sorted(set(pattern.findall(plan)))
+            if kwargs['verbosity'] > 1:
+                self.stdout.write(f'{name}:\n{plan}\n')
+            if scans:
+                regressions[name] = scans
+                self.stdout.write(f'{name}: scan on {", ".join(scans)}')
+            else:
+                self.stdout.write(f'{name}: ok')
+        if regressions:
+            raise CommandError(
+                f'Sequential scans in {len(regressions)} queries.'
+            )
@@ -0,0 +1,220 @@
+import random
+from itertools import accumulate, islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from recipes.bulk import CSVStream
+from recipes.counters import rebuild_counters
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from recipes.search import update_search_index
+from recipes.versions import (INGREDIENTS_VERSION, RECIPES_VERSION,
+                              TAGS_VERSION, bump_version)
+from users.models import Follow, User
+
+DISHES = ('Салат', 'Суп', 'Рагу', 'Пирог', 'Запеканка', 'Паста', 'Омлет')
+STYLES = ('по-домашнему', 'на скорую руку', 'праздничный', 'с травами')
+NAMES = ('Анна', 'Иван', 'Мария', 'Петр', 'Ольга', 'Сергей', 'Елена')
+SURNAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Орлов')
+
+
+class ZipfSampler:
+    """Выбор элементов с вероятностью, убывающей как 1 / rank ** s"""
+
+    def __init__(self, rng, population, exponent):
+        self.rng = rng
+        self.population = list(population)
+        rng.shuffle(self.population)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent
+            for rank in range(1, len(self.population) + 1)
+        ))
+
+    def one(self):
+        return self.rng.choices(
+            self.population, cum_weights=self.cum_weights
+        )[0]
+
+    def distinct(self, count):
+        """До count разных элементов: популярные выпадают чаще"""
+        count = min(count, len(self.population))
+        return set(self.rng.choices(
+            self.population, cum_weights=self.cum_weights, k=count
+        ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate users, follows, recipes, favorites and shopping carts '
+        'with skewed popularity for load testing. Uses COPY on PostgreSQL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=30)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument(
+            '--zipf',
+            type=float,
+            default=1.1,
+            help='Popularity skew exponent.',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if not ingredient_ids or not tag_ids:
+            raise CommandError(
+                'Import ingredients and tags before generating data.'
+            )
+        prefix = f'fake{options["seed"]}_'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Data for seed {options["seed"]} already exists.'
+            )
+        with transaction.atomic():
+            user_ids = self.create_users(prefix)
+            # Одна и та же популярность авторов для рецептов и подписок:
+            # у самых читаемых авторов больше всего рецептов.
+            authors = ZipfSampler(self.rng, user_ids, options['zipf'])
+            recipe_ids = self.create_recipes(authors, ingredient_ids)
+            self.create_recipe_relations(recipe_ids, ingredient_ids, tag_ids)
+            self.create_user_relations(user_ids, authors, recipe_ids)
+            rebuild_counters()
+            update_search_index()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        bump_version(INGREDIENTS_VERSION, TAGS_VERSION, RECIPES_VERSION)
+
+    def insert(self, model, fields, rows):
+        """Вставляет строки через COPY или пачками bulk_create"""
+        count = 0
+
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        rows = counted(rows)
+        fields = [model._meta.get_field(field) for field in fields]
+        if connection.vendor == 'postgresql':
+            columns = ', '.join(field.column for field in fields)
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f'COPY {model._meta.db_table} ({columns}) '
+                    'FROM STDIN WITH (FORMAT csv)',
+                    CSVStream(rows),
+                )
+        else:
+            batch_size = self.options['batch_size']
+            attnames = [field.attname for field in fields]
+            while True:
+                batch = [
+                    model(**dict(zip(attnames, row)))
+                    for row in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                model.objects.bulk_create(batch)
+        self.stdout.write(f'{model._meta.db_table}: {count} rows')
+
+    def new_ids(self, model, last_id):
+        return list(model.objects.filter(
+            id__gt=last_id
+        ).order_by('id').values_list('id', flat=True))
+
+    def last_id(self, model):
+        return model.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+
+    def create_users(self, prefix):
+        last_id = self.last_id(User)
+        now = timezone.now()
+        self.insert(User, (
+            'username', 'email', 'first_name', 'last_name', 'password',
+            'is_superuser', 'is_staff', 'is_active', 'date_joined',
+            'recipes_count', 'followers_count',
+        ), (
+            (
+                f'{prefix}{index}', f'{prefix}{index}@example.com',
+                self.rng.choice(NAMES), self.rng.choice(SURNAMES), '!',
+                False, False, True, now, 0, 0,
+            )
+            for index in range(self.options['users'])
+        ))
+        return self.new_ids(User, last_id)
+
+    def create_recipes(self, authors, ingredient_ids):
+        last_id = self.last_id(Recipe)
+        names = list(Ingredient.objects.filter(
+            id__in=self.rng.sample(ingredient_ids, min(
+                len(ingredient_ids), 500
+            ))
+        ).order_by('id').values_list('name', flat=True))
+        self.insert(Recipe, (
+            'author', 'name', 'text', 'cooking_time',
+            'favorites_count', 'shopping_cart_count',
+        ), (
+            (
+                authors.one(),
+                f'{self.rng.choice(DISHES)} {self.rng.choice(STYLES)}',
+                ', '.join(self.rng.sample(names, min(len(names), 5))),
+                self.rng.randint(5, 180), 0, 0,
+            )
+            for _ in range(self.options['recipes'])
+        ))
+        return self.new_ids(Recipe, last_id)
+
+    def create_recipe_relations(self, recipe_ids, ingredient_ids, tag_ids):
+        ingredients = ZipfSampler(
+            self.rng, ingredient_ids, self.options['zipf']
+        )
+        tags = ZipfSampler(self.rng, tag_ids, self.options['zipf'])
+        self.insert(RecipeIngredient, ('recipe', 'ingredient', 'amount'), (
+            (recipe_id, ingredient_id, self.rng.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in sorted(ingredients.distinct(self.rng.randint(
+                1, 2 * self.options['ingredients_per_recipe']
+            )))
+        ))
+        self.insert(RecipeTag, ('recipe', 'tag'), (
+            (recipe_id, tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in sorted(tags.distinct(
+                self.rng.randint(1, self.options['tags_per_recipe'])
+            ))
+        ))
+
+    def create_user_relations(self, user_ids, authors, recipe_ids):
+        recipes = ZipfSampler(self.rng, recipe_ids, self.options['zipf'])
+        self.insert(Follow, ('user', 'following'), (
+            (user_id, following_id)
+            for user_id in user_ids
+            for following_id in sorted(authors.distinct(
+                self.rng.randint(0, 2 * self.options['follows_per_user'])
+            ))
+            if following_id != user_id
+        ))
+        for model, per_user in (
+            (Favorite, self.options['favorites_per_user']),
+            (ShoppingCart, self.options['carts_per_user']),
+        ):
+            self.insert(model, ('user', 'recipe'), (
+                (user_id, recipe_id)
+                for user_id in user_ids
+                for recipe_id in sorted(recipes.distinct(
+                    self.rng.randint(0, 2 * per_user)
+                ))
+            ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from recipes.images import generate_variants, mark_variants_ready
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Generate resized variants for existing recipe images.'
+
+    def handle(self, *args, **kwargs):
+        names = Recipe.objects.exclude(
+            image__isnull=True
+        ).exclude(
+            image=''
+        ).values_list('image', flat=True).iterator()
+        generated = 0
+        for name in names:
+            try:
+                generate_variants(name)
+            except (OSError, ValueError) as error:
+                self.stderr.write(f'{name}: {error}')
+                continue
+            mark_variants_ready(name)
+            generated += 1
+        self.stdout.write(f'Generated variants for {generated} images.')
@@ -0,0 +1,68 @@
+import os
+import sys
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.reference_data import (READERS, REFERENCE_DATA,
+                                    import_reference_data)
+from recipes.versions import RECIPES_VERSION, bump_version
+
+
+class Command(BaseCommand):
+    help = (
+        'Idempotently import ingredients or tags from a CSV or JSON file '
+        'or stdin, inserting new rows and updating changed ones in batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(REFERENCE_DATA))
+        parser.add_argument(
+            'path',
+            nargs='?',
+            help='File to import, "-" for stdin. '
+                 'Defaults to the bundled recipes/data file.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help='Input format. Defaults to the file extension, csv for '
+                 'stdin.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        reference = REFERENCE_DATA[options['kind']]
+        path = options['path'] or reference.path
+        input_format = options['format']
+        if input_format is None:
+            extension = os.path.splitext(path)[1].lstrip('.').lower()
+            input_format = extension if extension in READERS else 'csv'
+        read = READERS[input_format]
+        started = perf_counter()
+        try:
+            if path == '-':
+                result = self.load(
+                    reference, read(sys.stdin, reference.fields), options
+                )
+            else:
+                with open(path, encoding='UTF-8', newline='') as file:
+                    result = self.load(
+                        reference, read(file, reference.fields), options
+                    )
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        elapsed = max(perf_counter() - started, 1e-6)
+        if result.inserted or result.updated:
+            bump_version(reference.version, RECIPES_VERSION)
+        self.stdout.write(
+            f'{options["kind"]}: {result.inserted} inserted, '
+            f'{result.updated} updated, {result.skipped} skipped '
+            f'in {elapsed:.2f}s ({result.total / elapsed:.0f} rows/s)'
+        )
+
+    def load(self, reference, rows, options):
+        with transaction.atomic():
+            return import_reference_data(
+                reference, rows, options['batch_size']
+            )
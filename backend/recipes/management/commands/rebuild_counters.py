@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.counters import find_counter_drift, rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild denormalized recipe and user counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report rows whose counters are out of date.',
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs['check']:
+            drift = find_counter_drift()
+            for counter, rows in drift.items():
+                self.stdout.write(f'{counter}: {rows} rows out of date')
+            if any(drift.values()):
+                raise CommandError('Counters are out of date.')
+            return
+        with transaction.atomic():
+            updated = rebuild_counters()
+        for counter, rows in updated.items():
+            self.stdout.write(f'{counter}: rebuilt {rows} rows')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.search import update_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all recipes.'
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            indexed = update_search_index()
+        self.stdout.write(f'Indexed {indexed} recipes.')
@@ -0,0 +1,20 @@
+# Generated by Django 3.2 on 2026-10-18 05:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Набор данных')),
+                ('version', models.FloatField(verbose_name='Время изменения')),
+            ],
+        ),
+    ]
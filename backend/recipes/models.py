@@ -1,7 +1,10 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models.functions import RowNumber
+from users.models import Follow
 from webcolors import normalize_hex
 
 User = get_user_model()
@@ -54,10 +57,81 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self, user):
+        """Подгружает автора, теги и ингредиенты фиксированным числом
+        запросов"""
+        if user.is_anonymous:
+            queryset = self.select_related('author')
+        else:
+            queryset = self.prefetch_related(
+                models.Prefetch(
+                    'author',
+                    queryset=User.objects.annotate(
+                        is_subscribed=models.Exists(
+                            Follow.objects.filter(
+                                user=user,
+                                following=models.OuterRef('pk'),
+                            )
+                        )
+                    ),
+                )
+            )
+        return queryset.prefetch_related(
+            models.Prefetch('tags', queryset=Tag.objects.all()),
+            models.Prefetch(
+                'recipe_ingredient',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+    def with_user_flags(self, user):
+        """Аннотирует флаги избранного и списка покупок для пользователя"""
+        if user.is_anonymous:
+            return self
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user,
+                    recipe=models.OuterRef('pk'),
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user,
+                    recipe=models.OuterRef('pk'),
+                )
+            ),
+        )
+
+    def latest_for_authors(self, author_ids, limit):
+        """Возвращает не более limit последних рецептов каждого автора
+        одним запросом с оконной функцией"""
+        if not author_ids:
+            return self.none()
+        queryset = self.filter(author__in=author_ids).annotate(
+            position=models.Window(
+                expression=RowNumber(),
+                partition_by=models.F('author'),
+                order_by=models.F('id').desc(),
+            )
+        ).order_by()
+        sql, params = queryset.query.sql_with_params()
+        return self.raw(
+            f'SELECT * FROM ({sql}) ranked '
+            'WHERE ranked.position <= %s ORDER BY ranked.id DESC',
+            (*params, limit)
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='recipes',
         verbose_name='Автор рецепта'
     )
@@ -74,6 +148,12 @@ class Recipe(models.Model):
         verbose_name='Изображение рецепта'
     )
 
+    image_variants_ready = models.BooleanField(
+        'Копии изображения созданы',
+        default=False,
+        editable=False,
+    )
+
     text = models.TextField(
         'Описание'
     )
@@ -100,7 +180,33 @@ class Recipe(models.Model):
         ],
     )
 
+    favorites_count = models.PositiveIntegerField(
+        'Количество добавлений в избранное',
+        default=0,
+        editable=False,
+    )
+
+    shopping_cart_count = models.PositiveIntegerField(
+        'Количество добавлений в список покупок',
+        default=0,
+        editable=False,
+    )
+
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
+        indexes = [
+            models.Index(
+                fields=['author', '-id'],
+                name='recipe_author_id_idx'
+            )
+        ]
         ordering = ['-id']
 
     def __str__(self):
@@ -111,11 +217,13 @@ class RecipeIngredient(models.Model):
     ingredient = models.ForeignKey(
         Ingredient,
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name='Ингредиент'
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='recipe_ingredient',
         verbose_name='Рецепт'
     )
@@ -134,6 +242,12 @@ class RecipeIngredient(models.Model):
                 name='unique_recipe_ingredient'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'ingredient', 'amount'],
+                name='recipeingredient_recipe_idx'
+            )
+        ]
         ordering = ['-id']
 
     def __str__(self):
@@ -144,11 +258,13 @@ class RecipeTag(models.Model):
     tag = models.ForeignKey(
         Tag,
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name='Тег'
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='recipe_tag',
         verbose_name='Рецепт'
     )
@@ -160,6 +276,12 @@ class RecipeTag(models.Model):
                 name='unique_recipe_tag'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'tag'],
+                name='recipetag_recipe_tag_idx'
+            )
+        ]
         ordering = ['-id']
 
     def __str__(self):
@@ -170,6 +292,7 @@ class Favorite(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='favorite',
         verbose_name='Подписчик'
     )
@@ -197,6 +320,7 @@ class ShoppingCart(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='shopping_cart',
         verbose_name='Покупатель'
     )
@@ -218,3 +342,19 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} {self.recipe}'
+
+
+class DataVersion(models.Model):
+    """Время последнего изменения набора данных.
+
+    Хранится в БД, чтобы все процессы видели одну и ту же версию.
+    """
+    name = models.CharField(
+        'Набор данных',
+        max_length=50,
+        primary_key=True,
+    )
+    version = models.FloatField('Время изменения')
+
+    def __str__(self):
+        return f'{self.name} {self.version}'
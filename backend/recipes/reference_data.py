@@ -0,0 +1,224 @@
+import csv
+import json
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+from recipes.bulk import CSVStream
+from recipes.models import Ingredient, Tag
+from recipes.versions import INGREDIENTS_VERSION, TAGS_VERSION
+
+DATA_DIR = os.path.join(settings.BASE_DIR, 'recipes', 'data')
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+class ReferenceData:
+    """Описание справочника: модель, поля и естественный ключ"""
+
+    def __init__(self, model, fields, key, version, filename):
+        self.model = model
+        self.fields = fields
+        self.key = key
+        self.version = version
+        self.path = os.path.join(DATA_DIR, filename)
+
+    @property
+    def update_fields(self):
+        return tuple(field for field in self.fields if field not in self.key)
+
+    def get_key(self, values):
+        return tuple(values[field] for field in self.key)
+
+
+REFERENCE_DATA = {
+    'ingredients': ReferenceData(
+        Ingredient,
+        fields=('name', 'measurement_unit'),
+        key=('name', 'measurement_unit'),
+        version=INGREDIENTS_VERSION,
+        filename='ingredients.csv',
+    ),
+    'tags': ReferenceData(
+        Tag,
+        fields=('name', 'color', 'slug'),
+        key=('slug',),
+        version=TAGS_VERSION,
+        filename='tags.csv',
+    ),
+}
+
+
+def read_csv(stream, fields):
+    for row in csv.reader(stream):
+        yield dict(zip(fields, row)) if len(row) == len(fields) else None
+
+
+def read_json(stream, fields):
+    """Читает JSON-массив или JSON Lines по частям, не загружая файл целиком"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n[],')
+        if not buffer:
+            if eof:
+                return
+            chunk = stream.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer = chunk
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = stream.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        if isinstance(item, dict):
+            yield {field: item.get(field) for field in fields}
+        else:
+            yield None
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+
+    @property
+    def total(self):
+        return self.inserted + self.updated + self.skipped
+
+
+def clean_rows(rows, reference, result):
+    """Отбрасывает строки без ключа и обрезает пробелы вокруг значений"""
+    for row in rows:
+        if row is not None:
+            row = {
+                field: value.strip() if isinstance(value, str) else value
+                for field, value in row.items()
+            }
+        if row is None or not all(row[field] for field in reference.key):
+            result.skipped += 1
+            continue
+        yield row
+
+
+def deduplicate(batch, reference, result):
+    """Оставляет последнюю строку для каждого ключа пачки"""
+    rows = {reference.get_key(row): row for row in batch}
+    result.skipped += len(batch) - len(rows)
+    return rows
+
+
+def upsert_batch(rows, reference, result):
+    """Вставляет новые строки и обновляет изменившиеся через ORM"""
+    model = reference.model
+    lookup = {f'{reference.key[0]}__in': [key[0] for key in rows]}
+    existing = {
+        reference.get_key(vars(instance)): instance
+        for instance in model.objects.filter(**lookup)
+    }
+    new, changed = [], []
+    for key, row in rows.items():
+        instance = existing.get(key)
+        if instance is None:
+            new.append(model(**row))
+            continue
+        if all(getattr(instance, field) == row[field]
+               for field in reference.update_fields):
+            result.skipped += 1
+            continue
+        for field in reference.update_fields:
+            setattr(instance, field, row[field])
+        changed.append(instance)
+    model.objects.bulk_create(new, ignore_conflicts=True)
+    if changed:
+        model.objects.bulk_update(changed, reference.update_fields)
+    result.inserted += len(new)
+    result.updated += len(changed)
+
+
+def copy_upsert_batch(rows, reference, result, staging):
+    """Загружает пачку через COPY во временную таблицу и делает
+    INSERT ... ON CONFLICT в основную"""
+    table = reference.model._meta.db_table
+    columns = ', '.join(reference.fields)
+    if reference.update_fields:
+        assignments = ', '.join(
+            f'{field} = EXCLUDED.{field}'
+            for field in reference.update_fields
+        )
+        current = ', '.join(
+            f'{table}.{field}' for field in reference.update_fields
+        )
+        excluded = ', '.join(
+            f'EXCLUDED.{field}' for field in reference.update_fields
+        )
+        conflict_action = (
+            f'DO UPDATE SET {assignments} '
+            f'WHERE ({current}) IS DISTINCT FROM ({excluded})'
+        )
+    else:
+        conflict_action = 'DO NOTHING'
+    with connection.cursor() as cursor:
+        cursor.execute(f'TRUNCATE {staging}')
+        cursor.copy_expert(
+            f'COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)',
+            CSVStream(
+                [row[field] for field in reference.fields]
+                for row in rows.values()
+            ),
+        )
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) '
+            f'SELECT {columns} FROM {staging} '
+            f'ON CONFLICT ({", ".join(reference.key)}) {conflict_action} '
+            'RETURNING xmax = 0'
+        )
+        statuses = [inserted for inserted, in cursor.fetchall()]
+    inserted = sum(statuses)
+    result.inserted += inserted
+    result.updated += len(statuses) - inserted
+    result.skipped += len(rows) - len(statuses)
+
+
+def import_reference_data(reference, rows, batch_size):
+    """Идемпотентно загружает строки справочника пачками по batch_size.
+
+    Повторная загрузка того же файла ничего не меняет: существующие по
+    естественному ключу записи обновляются только при изменении данных.
+    Вызывается внутри транзакции.
+    """
+    result = ImportResult()
+    rows = clean_rows(rows, reference, result)
+    staging = None
+    if connection.vendor == 'postgresql':
+        staging = f'{reference.model._meta.db_table}_import'
+        columns = ', '.join(f'{field} text' for field in reference.fields)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE IF NOT EXISTS {staging} '
+                f'({columns}) ON COMMIT DROP'
+            )
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return result
+        unique_rows = deduplicate(batch, reference, result)
+        if staging is None:
+            upsert_batch(unique_rows, reference, result)
+        else:
+            copy_upsert_batch(unique_rows, reference, result, staging)
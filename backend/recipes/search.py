@@ -0,0 +1,94 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from recipes.models import Recipe
+
+FTS_TABLE = 'recipes_recipe_fts'
+WORD_RE = re.compile(r'\w+')
+
+
+def get_search_vector():
+    return (
+        SearchVector('name', weight='A', config=settings.SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=settings.SEARCH_CONFIG)
+    )
+
+
+def update_search_index(recipe_ids=None):
+    """Обновляет поисковый индекс рецептов, без recipe_ids — целиком"""
+    queryset = Recipe.objects.all()
+    if recipe_ids is not None:
+        queryset = queryset.filter(pk__in=recipe_ids)
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        return queryset.update(search_vector=get_search_vector())
+    if connection.vendor != 'sqlite':
+        return 0
+    delete_sql = f'DELETE FROM {FTS_TABLE}'
+    insert_sql = (
+        f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+        'SELECT id, name, text FROM recipes_recipe'
+    )
+    params = []
+    if recipe_ids is not None:
+        params = list(recipe_ids)
+        if not params:
+            return 0
+        placeholders = ', '.join(['%s'] * len(params))
+        delete_sql += f' WHERE rowid IN ({placeholders})'
+        insert_sql += f' WHERE id IN ({placeholders})'
+    with connection.cursor() as cursor:
+        cursor.execute(delete_sql, params)
+        cursor.execute(insert_sql, params)
+        return cursor.rowcount
+
+
+def remove_from_search_index(recipe_id, using):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', (recipe_id,)
+        )
+
+
+def search_recipes(queryset, query):
+    """Отбирает рецепты по поисковой строке и сортирует по релевантности.
+
+    На PostgreSQL используется хранимый tsvector с GIN-индексом и
+    websearch-синтаксис запроса, на SQLite — таблица FTS5 с поиском по
+    префиксам слов, на остальных СУБД — icontains по названию и описанию.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=settings.SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-id')
+    words = WORD_RE.findall(query)
+    if not words:
+        return queryset.none()
+    if vendor != 'sqlite':
+        for word in words:
+            queryset = queryset.filter(
+                Q(name__icontains=word) | Q(text__icontains=word)
+            )
+        return queryset
+    match = ' '.join(f'"{word}"*' for word in words)
+    return queryset.filter(id__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match,),
+    )).annotate(rank=RawSQL(
+        f'SELECT bm25({FTS_TABLE}, 2.0, 1.0) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = recipes_recipe.id',
+        (match,),
+        output_field=FloatField(),
+    )).order_by('rank', '-id')
@@ -0,0 +1,113 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from recipes.counters import change_counter, release_user_counters
+from recipes.images import schedule_delete_variants, schedule_variants
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import remove_from_search_index, update_search_index
+from recipes.versions import (INGREDIENTS_VERSION, RECIPES_VERSION,
+                              TAGS_VERSION, bump_version_on_commit)
+from users.models import User
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_changed(**kwargs):
+    bump_version_on_commit(INGREDIENTS_VERSION, RECIPES_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_changed(**kwargs):
+    bump_version_on_commit(TAGS_VERSION, RECIPES_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipes_changed(**kwargs):
+    bump_version_on_commit(RECIPES_VERSION)
+
+
+@receiver((post_save, post_delete), sender=User)
+def author_changed(created=False, **kwargs):
+    if not created:
+        bump_version_on_commit(RECIPES_VERSION)
+
+
+def field_saved(instance, update_fields, name):
+    """Сохраняется ли поле: оно загружено и входит в update_fields"""
+    attname = instance._meta.get_field(name).attname
+    if attname in instance.get_deferred_fields():
+        return False
+    return update_fields is None or name in update_fields
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_changing(instance, update_fields, **kwargs):
+    """Сравнивает изображение и автора рецепта с сохраненными в БД"""
+    names = [
+        name for name in ('image', 'author')
+        if field_saved(instance, update_fields, name)
+    ]
+    if instance.pk is None or not names:
+        return
+    previous = Recipe.objects.filter(pk=instance.pk).values(*names).first()
+    if previous is None:
+        return
+    if 'image' in previous and previous['image'] != instance.image.name:
+        if previous['image']:
+            schedule_delete_variants(previous['image'])
+        instance.image_variants_ready = False
+    old_author = previous.get('author', instance.author_id)
+    if old_author != instance.author_id:
+        change_counter(User, old_author, 'recipes_count', -1)
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(instance, **kwargs):
+    release_user_counters(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(instance, update_fields, **kwargs):
+    """Ставит создание копий нового изображения.
+
+    Копии создаются заново и тогда, когда сохранение затерло отметку о
+    готовых копиях, сделанную пулом потоков после чтения рецепта.
+    """
+    if (not field_saved(instance, update_fields, 'image')
+            or not instance.image or instance.image_variants_ready):
+        return
+    if (update_fields is not None
+            and 'image_variants_ready' not in update_fields):
+        Recipe.objects.filter(pk=instance.pk).update(
+            image_variants_ready=False
+        )
+    schedule_variants(instance.image.name)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_deleted(instance, **kwargs):
+    if 'image' not in instance.get_deferred_fields() and instance.image:
+        schedule_delete_variants(instance.image.name)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_saved(instance, update_fields, **kwargs):
+    if update_fields is not None and not {'name', 'text'} & update_fields:
+        return
+    update_search_index([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_search_deleted(instance, using, **kwargs):
+    remove_from_search_index(instance.pk, using)
@@ -0,0 +1,282 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from PIL import Image
+from recipes import images, versions
+from recipes.counters import find_counter_drift
+from recipes.ingredient_index import IngredientIndex
+from recipes.models import DataVersion, Ingredient, Recipe
+from recipes.versions import (INGREDIENTS_VERSION, RECIPES_VERSION,
+                              TAGS_VERSION, VERSION_KEY, bump_version,
+                              get_version, get_versions)
+from rest_framework.test import APIClient
+from users.models import User
+
+
+@override_settings(DATA_VERSION_CHECK_INTERVAL=60)
+class DataVersionTests(TestCase):
+    """Версии данных: общее хранилище и проверка раз в интервал"""
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        versions._checked.clear()
+
+    def test_version_is_checked_once_per_interval(self):
+        version = get_version(RECIPES_VERSION)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_version(RECIPES_VERSION), version)
+        # Изменение из другого процесса.
+        DataVersion.objects.filter(
+            name=RECIPES_VERSION
+        ).update(version=version + 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_version(RECIPES_VERSION), version)
+        with override_settings(DATA_VERSION_CHECK_INTERVAL=0):
+            with self.assertNumQueries(1):
+                self.assertEqual(get_version(RECIPES_VERSION), version + 1)
+
+    def test_bump_is_visible_in_process_at_once(self):
+        old_recipes, old_tags = get_versions([RECIPES_VERSION, TAGS_VERSION])
+        bump_version(RECIPES_VERSION)
+        with self.assertNumQueries(0):
+            recipes, tags = get_versions([RECIPES_VERSION, TAGS_VERSION])
+        self.assertGreater(recipes, old_recipes)
+        self.assertEqual(tags, old_tags)
+        versions._checked.clear()
+        self.assertEqual(get_version(RECIPES_VERSION), recipes)
+
+    def test_versions_of_missing_sets_are_read_in_one_query(self):
+        with self.assertNumQueries(3):
+            get_versions([RECIPES_VERSION, TAGS_VERSION])
+        versions._checked.clear()
+        with self.assertNumQueries(1):
+            get_versions([RECIPES_VERSION, TAGS_VERSION])
+
+    @override_settings(API_CACHE_SHARED=True)
+    def test_shared_cache_keeps_versions_without_database(self):
+        with self.assertNumQueries(0):
+            version = get_version(RECIPES_VERSION)
+            bump_version(RECIPES_VERSION)
+            versions._checked.clear()
+            bumped = get_version(RECIPES_VERSION)
+        self.assertGreater(bumped, version)
+        self.assertFalse(DataVersion.objects.exists())
+
+    @override_settings(API_CACHE_SHARED=True)
+    def test_lost_shared_version_starts_new_one(self):
+        version = get_version(RECIPES_VERSION)
+        caches[settings.API_CACHE_ALIAS].delete(
+            VERSION_KEY.format(RECIPES_VERSION)
+        )
+        versions._checked.clear()
+        self.assertGreater(get_version(RECIPES_VERSION), version)
+
+
+@override_settings(DATA_VERSION_CHECK_INTERVAL=60)
+class IngredientIndexTests(TestCase):
+    """Поиск ингредиентов по индексу в памяти процесса"""
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        versions._checked.clear()
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Сахар', 'сахарная пудра', 'Тростниковый сахар',
+                         'Соль')
+        )
+        bump_version(INGREDIENTS_VERSION)
+        self.index = IngredientIndex()
+
+    def search(self, query):
+        return [row['name'] for row in self.index.search(query, 10)]
+
+    def test_prefix_matches_go_first(self):
+        self.assertEqual(
+            self.search('сах'),
+            ['Сахар', 'сахарная пудра', 'Тростниковый сахар'],
+        )
+
+    def test_search_does_not_query_database(self):
+        self.search('с')
+        with self.assertNumQueries(0):
+            for query in ('с', 'са', 'сах', 'саха', 'сахар'):
+                self.search(query)
+
+    def test_index_is_rebuilt_after_version_change(self):
+        self.assertEqual(self.search('перец'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Перец', measurement_unit='г')
+        self.assertEqual(self.search('перец'), ['Перец'])
+
+
+@override_settings(DB_REPLICAS=[])
+class ImageVariantsTests(TransactionTestCase):
+    """Уменьшенные копии изображений рецептов.
+
+    TransactionTestCase нужен, чтобы создание копий после фиксации
+    транзакции выполнялось; пул потоков в тестах работает синхронно.
+    """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        inline = mock.patch.object(
+            images.executor, 'submit', lambda function, *args: function(*args)
+        )
+        inline.start()
+        self.addCleanup(inline.stop)
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        versions._checked.clear()
+        self.author = User.objects.create(username='author', email='a@x.com')
+
+    def save_image(self, name):
+        image = BytesIO()
+        Image.new('RGB', (1600, 1200)).save(image, 'PNG')
+        return default_storage.save(
+            f'recipe/images/{name}', ContentFile(image.getvalue())
+        )
+
+    def create_recipe(self, image):
+        return Recipe.objects.create(
+            author=self.author, name='recipe', text='text', cooking_time=10,
+            image=image,
+        )
+
+    def get_variants(self, recipe):
+        response = APIClient().get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        return {
+            url
+            for formats in response.data['image_variants'].values()
+            for url in formats.values()
+        }
+
+    def test_variants_are_created_and_marked(self):
+        name = self.save_image('a.png')
+        with mock.patch.object(images.executor, 'submit') as submit:
+            recipe = self.create_recipe(name)
+        version = get_version(RECIPES_VERSION)
+        for (function, *args), _ in submit.call_args_list:
+            function(*args)
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_variants_ready)
+        self.assertGreater(get_version(RECIPES_VERSION), version)
+        for variant in settings.RECIPE_IMAGE_VARIANTS:
+            for extension in images.get_image_formats():
+                self.assertTrue(default_storage.exists(
+                    images.variant_name(name, variant, extension)
+                ))
+        urls = self.get_variants(recipe)
+        self.assertNotIn(f'http://testserver/media/{name}', urls)
+
+    def test_urls_fall_back_to_original_without_storage_calls(self):
+        name = self.save_image('b.png')
+        with mock.patch.object(images.executor, 'submit'):
+            recipe = self.create_recipe(name)
+        with mock.patch(
+            'django.core.files.storage.FileSystemStorage.exists',
+            side_effect=AssertionError('storage must not be queried'),
+        ):
+            self.assertEqual(
+                self.get_variants(recipe),
+                {f'http://testserver/media/{name}'},
+            )
+
+    def test_new_image_replaces_variants(self):
+        old_name = self.save_image('c.png')
+        recipe = self.create_recipe(old_name)
+        old_variant = images.variant_name(
+            old_name, 'thumbnail', next(iter(images.get_image_formats()))
+        )
+        self.assertTrue(default_storage.exists(old_variant))
+        with mock.patch.object(images.executor, 'submit') as submit:
+            recipe.image = self.save_image('d.png')
+            recipe.save(update_fields=['image'])
+        recipe.refresh_from_db()
+        self.assertFalse(recipe.image_variants_ready)
+        for (function, *args), _ in submit.call_args_list:
+            function(*args)
+        self.assertFalse(default_storage.exists(old_variant))
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_variants_ready)
+
+
+@override_settings(DB_REPLICAS=[])
+class RecipesCountTests(TestCase):
+    """Счетчик рецептов автора при создании, смене автора и удалении"""
+
+    def setUp(self):
+        self.authors = [
+            User.objects.create(username=f'author{i}', email=f'a{i}@x.com')
+            for i in range(2)
+        ]
+
+    def create_recipe(self, author):
+        return Recipe.objects.create(
+            author=author, name='recipe', text='text', cooking_time=10,
+            image='recipe/images/test.png',
+        )
+
+    def assert_counts(self, *counts):
+        self.assertEqual([
+            User.objects.get(pk=author.pk).recipes_count
+            for author in self.authors
+        ], list(counts))
+        self.assertEqual(set(find_counter_drift().values()), {0})
+
+    def test_create_and_delete(self):
+        recipe = self.create_recipe(self.authors[0])
+        self.create_recipe(self.authors[0])
+        self.assert_counts(2, 0)
+        recipe.delete()
+        self.assert_counts(1, 0)
+        Recipe.objects.all().delete()
+        self.assert_counts(0, 0)
+
+    def test_author_change(self):
+        recipe = self.create_recipe(self.authors[0])
+        recipe.author = self.authors[1]
+        recipe.save()
+        self.assert_counts(0, 1)
+        recipe.author = self.authors[0]
+        recipe.save(update_fields=['author'])
+        self.assert_counts(1, 0)
+
+    def test_save_without_author_keeps_count(self):
+        recipe = self.create_recipe(self.authors[0])
+        recipe = Recipe.objects.only('name').get(pk=recipe.pk)
+        recipe.name = 'new name'
+        recipe.save()
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        recipe.author = self.authors[1]
+        recipe.save(update_fields=['name'])
+        self.assert_counts(1, 0)
+
+    def test_delete_through_api(self):
+        recipe = self.create_recipe(self.authors[0])
+        self.create_recipe(self.authors[1])
+        client = APIClient()
+        client.force_authenticate(self.authors[0])
+        response = client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_counts(0, 1)
+
+    def test_author_deletion(self):
+        self.create_recipe(self.authors[0])
+        self.create_recipe(self.authors[1])
+        self.authors.pop(0).delete()
+        self.assert_counts(1)
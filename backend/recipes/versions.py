@@ -0,0 +1,101 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from recipes.models import DataVersion
+
+INGREDIENTS_VERSION = 'ingredients'
+TAGS_VERSION = 'tags'
+RECIPES_VERSION = 'recipes'
+
+VERSION_KEY = 'data_version:{}'
+
+# Версии, прочитанные процессом: имя -> (версия, время проверки).
+_checked = {}
+
+
+def read_versions(names):
+    """Читает версии из общего хранилища.
+
+    С общим кешем API версии хранятся только в нем. Если версии в кеше нет,
+    начинается новая: старое значение могло бы вернуть из кеша ответы,
+    собранные до последних изменений. С кешем в памяти процесса версии
+    хранятся в таблице БД, чтобы все процессы видели одни и те же.
+    """
+    now = time.time()
+    if settings.API_CACHE_SHARED:
+        cache = caches[settings.API_CACHE_ALIAS]
+        keys = {name: VERSION_KEY.format(name) for name in names}
+        found = cache.get_many(keys.values())
+        for name, key in keys.items():
+            if key not in found:
+                cache.add(key, now, None)
+        if len(found) < len(keys):
+            found = cache.get_many(keys.values())
+        return {name: found.get(key, now) for name, key in keys.items()}
+    versions = dict(DataVersion.objects.filter(
+        name__in=names
+    ).values_list('name', 'version'))
+    missing = [name for name in names if name not in versions]
+    if missing:
+        DataVersion.objects.bulk_create(
+            [DataVersion(name=name, version=now) for name in missing],
+            ignore_conflicts=True,
+        )
+        versions.update(DataVersion.objects.filter(
+            name__in=missing
+        ).values_list('name', 'version'))
+    return versions
+
+
+def get_versions(names):
+    """Возвращает текущие версии наборов данных.
+
+    Версия - время последнего изменения данных, поэтому ее же можно
+    использовать как Last-Modified. Процесс перечитывает версию не чаще
+    раза в DATA_VERSION_CHECK_INTERVAL секунд, поэтому изменения из других
+    процессов видны с такой задержкой, а свои - сразу.
+    """
+    now = time.time()
+    interval = settings.DATA_VERSION_CHECK_INTERVAL
+    versions = {}
+    for name in names:
+        checked = _checked.get(name)
+        if checked is not None and now - checked[1] < interval:
+            versions[name] = checked[0]
+    stale = [name for name in names if name not in versions]
+    if stale:
+        for name, version in read_versions(stale).items():
+            _checked[name] = (version, now)
+            versions[name] = version
+    return [versions[name] for name in names]
+
+
+def get_version(name):
+    return get_versions([name])[0]
+
+
+def bump_version(*names):
+    """Помечает наборы данных измененными"""
+    now = time.time()
+    if settings.API_CACHE_SHARED:
+        caches[settings.API_CACHE_ALIAS].set_many(
+            {VERSION_KEY.format(name): now for name in names}, None
+        )
+    else:
+        updated = DataVersion.objects.filter(
+            name__in=names
+        ).update(version=now)
+        if updated < len(names):
+            DataVersion.objects.bulk_create(
+                [DataVersion(name=name, version=now) for name in names],
+                ignore_conflicts=True,
+            )
+    for name in names:
+        _checked[name] = (now, now)
+
+
+def bump_version_on_commit(*names):
+    """Помечает наборы данных измененными после фиксации транзакции"""
+    transaction.on_commit(lambda: bump_version(*names))
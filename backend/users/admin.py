@@ -12,6 +12,8 @@ class User2Admin(UserAdmin):
         'last_name',
         'password',
         'is_staff',
+        'recipes_count',
+        'followers_count',
     )
 
     list_filter = ('email', 'username')
@@ -0,0 +1,43 @@
+from api.include.async_api import (api_response, async_api_view,
+                                   database_sync_to_async)
+from api.serializers import UserSubscribeSerializer
+from recipes.counters import add_counted_relation, remove_counted_relation
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from users.models import Follow, User
+
+
+def toggle_subscription(request, pk):
+    """Подписывает пользователя на автора или отписывает от него"""
+    try:
+        if request.method == 'DELETE':
+            if remove_counted_relation(
+                Follow, user_id=request.user.id, following_id=pk
+            ):
+                return api_response(status=status.HTTP_204_NO_CONTENT)
+            return api_response(
+                ['Вы не подписаны на данного пользователя'],
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        following_user = add_counted_relation(
+            Follow,
+            ('email', 'username', 'first_name', 'last_name', 'recipes_count'),
+            user_id=request.user.id, following_id=pk,
+        )
+    except User.DoesNotExist:
+        raise NotFound
+    if following_user is None:
+        return api_response(
+            ['Вы уже подписаны на данного пользователя'],
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    following_user.is_subscribed = True
+    serializer = UserSubscribeSerializer(
+        following_user, context={'request': request}
+    )
+    return api_response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+@async_api_view(('POST', 'DELETE'), authenticated=True)
+async def subscribe(request, pk):
+    return await database_sync_to_async(toggle_subscription)(request, pk)
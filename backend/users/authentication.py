@@ -0,0 +1,110 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+AUTH_VERSION_KEY = 'auth_version:{}'
+
+
+class TokenCache:
+    """LRU-кеш соответствия токена пользователю с ограниченным сроком
+    жизни записей. Кеш локален для процесса."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, credentials = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return credentials
+
+    def set(self, key, credentials):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, credentials)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+def get_auth_version(user_id):
+    """Метка пользователя в общем кеше API, меняющаяся при его изменении
+    и удалении его токенов"""
+    cache = caches[settings.API_CACHE_ALIAS]
+    key = AUTH_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        return cache.get(key)
+    return version
+
+
+def revoke_cached_credentials(user_id):
+    """Меняет метку пользователя после фиксации транзакции: записи кеша
+    токенов во всех процессах перестают действовать"""
+    transaction.on_commit(lambda: caches[settings.API_CACHE_ALIAS].set(
+        AUTH_VERSION_KEY.format(user_id), uuid.uuid4().hex, timeout=None
+    ))
+
+
+def get_values(instance):
+    return tuple(
+        getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+    )
+
+
+def from_values(model, values):
+    """Новый экземпляр модели из сохраненных значений полей"""
+    return model.from_db(DEFAULT_DB_ALIAS, [
+        field.attname for field in model._meta.concrete_fields
+    ], values)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кешированием пользователя.
+
+    В кеше процесса хранятся значения полей пользователя и токена, по
+    которым на каждый запрос создаются новые экземпляры моделей. Запись
+    действует, пока не изменилась метка пользователя в общем кеше API.
+    Выключается настройкой TOKEN_CACHE_ENABLED.
+    """
+
+    def authenticate_credentials(self, key):
+        if not settings.TOKEN_CACHE_ENABLED:
+            return super().authenticate_credentials(key)
+        entry = token_cache.get(key)
+        if entry is not None:
+            version, user_values, token_values = entry
+            user = from_values(User, user_values)
+            if get_auth_version(user.pk) == version:
+                return user, from_values(Token, token_values)
+            token_cache.invalidate(key)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (
+            get_auth_version(user.pk), get_values(user), get_values(token)
+        ))
+        return user, token
@@ -33,6 +33,16 @@ class User(AbstractUser):
         'Фамилия',
         max_length=150,
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['-id']
@@ -45,12 +55,14 @@ class Follow(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='follower',
         verbose_name='Подписчик'
     )
     following = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='following',
         verbose_name='Автор подписки'
     )
@@ -62,6 +74,12 @@ class Follow(models.Model):
                 name='unique_together'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['following', 'user'],
+                name='follow_following_user_idx'
+            )
+        ]
         ordering = ['-id']
 
     def __str__(self):
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from users.authentication import revoke_cached_credentials, token_cache
+from users.models import User
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    token_cache.invalidate(instance.key)
+    revoke_cached_credentials(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(instance, **kwargs):
+    revoke_cached_credentials(instance.pk)
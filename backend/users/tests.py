@@ -0,0 +1,149 @@
+from unittest import mock
+
+from api.serializers import UserSubscribeSerializer
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from recipes.models import Recipe
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from users.authentication import token_cache
+from users.models import Follow, User
+
+
+@override_settings(TOKEN_CACHE_ENABLED=True, DB_REPLICAS=[])
+class TokenCacheTests(TestCase):
+    """Кеш токенов: запись перестает действовать после выхода и смены
+    пароля, в том числе в других процессах"""
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create(username='user', email='u@x.com')
+        self.user.set_password('old-password')
+        self.user.save()
+        self.token = Token.objects.create(user=self.user)
+        self.addCleanup(token_cache.invalidate, self.token.key)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_me(self):
+        """Ответ /api/users/me/ и SQL-запросы к таблице токенов"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/me/')
+        return response, [
+            query['sql'] for query in queries.captured_queries
+            if '"authtoken_token"' in query['sql']
+        ]
+
+    def test_token_is_read_from_cache(self):
+        response, token_queries = self.get_me()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(token_queries)
+        response, token_queries = self.get_me()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(token_queries, [])
+
+    def test_token_is_rejected_after_logout(self):
+        self.get_me()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        response, _ = self.get_me()
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_is_rejected_after_logout_in_other_process(self):
+        self.get_me()
+        # Другой процесс удаляет токен: кеш этого процесса не очищается,
+        # меняется только метка пользователя в общем кеше API.
+        with mock.patch.object(token_cache, 'invalidate'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Token.objects.filter(user=self.user).delete()
+        response, _ = self.get_me()
+        self.assertEqual(response.status_code, 401)
+
+    def test_cached_user_is_dropped_after_password_change(self):
+        self.get_me()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': 'old-password',
+                'new_password': 'new-password',
+            })
+        self.assertEqual(response.status_code, 204)
+        response, token_queries = self.get_me()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(token_queries)
+        # Пользователь из кеша со старым хешем принял бы старый пароль.
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'old-password',
+            'new_password': 'other-password',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(DB_REPLICAS=[])
+class SubscriptionsTests(TestCase):
+    """Подписки: число SQL-запросов не зависит от числа авторов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reader', email='r@x.com')
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.authors = []
+
+    def add_authors(self, count):
+        for _ in range(count):
+            index = len(self.authors)
+            author = User.objects.create(
+                username=f'author{index}', email=f'a{index}@x.com'
+            )
+            for number in range(3):
+                Recipe.objects.create(
+                    author=author, name=f'recipe {number}', text='text',
+                    cooking_time=10, image='recipe/images/test.png',
+                )
+            Follow.objects.create(user=self.user, following=author)
+            self.authors.append(author)
+        # Число подписок кешируется: запрос за ним входит в проверяемое
+        # число.
+        caches['default'].clear()
+
+    def test_query_count_does_not_grow_with_authors(self):
+        for count in (1, 5):
+            self.add_authors(count)
+            # Число подписок, авторы страницы, последние рецепты авторов.
+            with self.assertNumQueries(3):
+                response = self.client.get(
+                    '/api/users/subscriptions/',
+                    {'limit': 100, 'recipes_limit': 2},
+                )
+            self.assertEqual(response.status_code, 200)
+            results = response.data['results']
+            self.assertEqual(
+                [author['id'] for author in results],
+                [author.id for author in reversed(self.authors)],
+            )
+            for author in results:
+                self.assertTrue(author['is_subscribed'])
+                self.assertEqual(author['recipes_count'], 3)
+                self.assertEqual(len(author['recipes']), 2)
+
+    def test_list_without_recipes_context_is_rejected(self):
+        self.add_authors(2)
+        request = APIRequestFactory().get('/api/users/subscriptions/')
+        context = {'request': Request(request)}
+        with self.assertRaises(ImproperlyConfigured):
+            UserSubscribeSerializer(
+                self.authors, many=True, context=context
+            ).data
+        data = UserSubscribeSerializer(self.authors[0], context=context).data
+        self.assertEqual(len(data['recipes']), settings.RECIPES_LIMIT)
@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
+from users import async_views
 from users.views import TokenViewSet, UserViewSet
 
 users_router = routers.DefaultRouter()
@@ -8,7 +10,12 @@ users_router.register('users', UserViewSet)
 token_router = routers.DefaultRouter()
 token_router.register('token', TokenViewSet, basename='token')
 
+async_urlpatterns = [
+    path('users/<int:pk>/subscribe/', async_views.subscribe),
+]
+
 urlpatterns = [
+    *(async_urlpatterns if settings.ASYNC_VIEWS_ENABLED else []),
     path('', include(users_router.urls)),
     path('auth/', include(token_router.urls)),
 ]
@@ -1,10 +1,16 @@
-from api.include.pagination import PageNumberLimitPagination
-from api.serializers import UserSubscribeSerializer
+from collections import defaultdict
+
+from api.include.pagination import PageNumberOrCursorPagination
+from api.serializers import UserSubscribeSerializer, get_recipes_limit
 from django.contrib.auth.hashers import check_password
-from django.shortcuts import get_object_or_404
+from django.db.models import BooleanField, Value
+from foodgram.routers import ReplicaReadsMixin
+from recipes.counters import add_counted_relation, remove_counted_relation
+from recipes.models import Recipe
 from rest_framework import mixins, status
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
@@ -13,13 +19,14 @@ from users.serializers import (TokenSerializer, UserCreateSerializer,
                                UserSerializer)
 
 
-class UserViewSet(mixins.CreateModelMixin,
+class UserViewSet(ReplicaReadsMixin,
+                  mixins.CreateModelMixin,
                   mixins.RetrieveModelMixin,
                   mixins.ListModelMixin,
                   GenericViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
-    pagination_class = PageNumberLimitPagination
+    pagination_class = PageNumberOrCursorPagination
 
     def create(self, request, *args, **kwargs):
         serializer = UserCreateSerializer(data=request.data)
@@ -35,7 +42,7 @@ class UserViewSet(mixins.CreateModelMixin,
         permission_classes=(IsAuthenticated,),
     )
     def me(self, request):
-        user = get_object_or_404(User, username=self.request.user.username)
+        user = request.user
         serializer = self.get_serializer(user)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -45,7 +52,7 @@ class UserViewSet(mixins.CreateModelMixin,
         permission_classes=(IsAuthenticated,),
     )
     def set_password(self, request):
-        user = get_object_or_404(User, username=self.request.user.username)
+        user = request.user
         if not check_password(request.data['current_password'], user.password):
             return Response(
                 {'Введен неверный пароль'},
@@ -64,10 +71,35 @@ class UserViewSet(mixins.CreateModelMixin,
     def subscriptions(self, request):
         queryset = User.objects.filter(
             following__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).order_by('-id')
+        page = self.paginate_queryset(queryset)
+        authors = page if page is not None else list(queryset)
+        serializer = self.get_serializer(
+            authors,
+            many=True,
+            context={
+                **self.get_serializer_context(),
+                'recipes_by_author': self.get_recipes_by_author(authors),
+            },
+        )
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def get_recipes_by_author(self, authors):
+        """Группирует последние рецепты авторов страницы по автору"""
+        recipes_by_author = defaultdict(list)
+        recipes = Recipe.objects.only(
+            'author', 'name', 'image', 'image_variants_ready', 'cooking_time'
+        ).latest_for_authors(
+            [author.id for author in authors],
+            get_recipes_limit(self.request),
         )
-        paginated_queryset = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(paginated_queryset, many=True)
-        return self.get_paginated_response(serializer.data)
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        return recipes_by_author
 
     @action(
         detail=True,
@@ -76,26 +108,31 @@ class UserViewSet(mixins.CreateModelMixin,
         serializer_class=UserSubscribeSerializer
     )
     def subscribe(self, request, pk):
-        following_user = get_object_or_404(User, id=pk)
-        user = get_object_or_404(User, username=self.request.user.username)
-        if request.method == 'DELETE':
-            subscribe = user.follower.filter(following=following_user).first()
-            if subscribe:
-                subscribe.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response(
-                {'Вы не подписаны на данного пользователя'},
-                status=status.HTTP_400_BAD_REQUEST
+        try:
+            following_id = int(pk)
+            if request.method == 'DELETE':
+                if remove_counted_relation(
+                    Follow, user_id=request.user.id, following_id=following_id
+                ):
+                    return Response(status=status.HTTP_204_NO_CONTENT)
+                return Response(
+                    {'Вы не подписаны на данного пользователя'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            following_user = add_counted_relation(
+                Follow,
+                ('email', 'username', 'first_name', 'last_name',
+                 'recipes_count'),
+                user_id=request.user.id, following_id=following_id,
             )
-        subscribe, created = Follow.objects.get_or_create(
-            user=user,
-            following=following_user
-        )
-        if not created:
+        except (ValueError, User.DoesNotExist):
+            raise NotFound
+        if following_user is None:
             return Response(
                 {'Вы уже подписаны на данного пользователя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        following_user.is_subscribed = True
         serializer = self.get_serializer(following_user)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -0,0 +1,23 @@
+# Конфигурация gunicorn для запуска foodgram.asgi:application.
+#
+# Один процесс uvicorn обслуживает много медленных клиентов, не занимая
+# под каждого отдельный процесс. Асинхронные представления
+# (ASYNC_VIEWS_ENABLED=True) выполняют запросы к БД в пуле из
+# ASYNC_DB_THREADS потоков, поэтому на процесс приходится не больше
+# ASYNC_DB_THREADS + 1 соединений с БД.
+#
+# При нескольких процессах кеш API (API_CACHE_BACKEND) должен быть общим,
+# например memcached из docker-compose.asgi.yml: с кешем в памяти процесса
+# кеш токенов выключается, а привязка к основной БД после записи видна
+# только процессу, обработавшему запись.
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+# Перезапуск процессов ограничивает рост памяти.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = timeout
+keepalive = 5
@@ -0,0 +1,129 @@
+"""Нагрузочный тест backend без сторонних зависимостей.
+
+Открывает --concurrency соединений, каждое в цикле отправляет запрос с
+заголовком Connection: close. С --client-delay клиент делает паузу между
+заголовками и концом запроса, как медленный мобильный клиент: синхронный
+процесс gunicorn все это время занят. С --server-pid в отчет добавляется
+суммарная память (RSS) процесса сервера и его дочерних процессов.
+
+    python loadtest.py http://localhost:8000/api/ingredients/?name=мол \\
+        --concurrency 200 --duration 30 --client-delay 0.5 --server-pid 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, -(-len(ordered) * percent // 100) - 1)
+    return ordered[int(index)]
+
+
+def get_rss_mb(pid):
+    """RSS процесса и всех его потомков в мегабайтах"""
+    total = 0
+    pids = [pid]
+    while pids:
+        pid = pids.pop()
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    total += int(line.split()[1])
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as file:
+                pids.extend(int(child) for child in file.read().split())
+    return round(total / 1024, 1)
+
+
+async def send(url, head, tail, client_delay):
+    reader, writer = await asyncio.open_connection(url.hostname, url.port)
+    try:
+        writer.write(head)
+        if client_delay:
+            await writer.drain()
+            await asyncio.sleep(client_delay)
+        writer.write(tail)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1])
+
+
+async def client(url, head, tail, options, deadline, stats):
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            status = await send(url, head, tail, options.client_delay)
+        except (OSError, IndexError, ValueError):
+            status = None
+        if status is None or status >= 400:
+            stats['errors'] += 1
+        else:
+            stats['latencies'].append((time.monotonic() - started) * 1000)
+
+
+async def run(options):
+    url = urlsplit(options.url)
+    target = url.path + (f'?{url.query}' if url.query else '')
+    headers = [
+        f'{options.method} {target} HTTP/1.1',
+        f'Host: {url.netloc}',
+        'Accept: application/json',
+        'Connection: close',
+    ]
+    if options.token:
+        headers.append(f'Authorization: Token {options.token}')
+    head = '\r\n'.join(headers).encode() + b'\r\n'
+    tail = b'Content-Length: 0\r\n\r\n'
+    stats = {'latencies': [], 'errors': 0}
+    deadline = time.monotonic() + options.duration
+    tasks = [
+        client(url, head, tail, options, deadline, stats)
+        for _ in range(options.concurrency)
+    ]
+    rss_mb = []
+    if options.server_pid:
+        async def sample_memory():
+            while time.monotonic() < deadline:
+                rss_mb.append(get_rss_mb(options.server_pid))
+                await asyncio.sleep(1)
+        tasks.append(sample_memory())
+    await asyncio.gather(*tasks)
+    latencies = stats['latencies']
+    report = {
+        'url': options.url,
+        'concurrency': options.concurrency,
+        'client_delay': options.client_delay,
+        'requests': len(latencies),
+        'errors': stats['errors'],
+        'rps': round(len(latencies) / options.duration, 1),
+    }
+    if latencies:
+        report['p50_ms'] = round(percentile(latencies, 50), 1)
+        report['p95_ms'] = round(percentile(latencies, 95), 1)
+    if rss_mb:
+        report['max_rss_mb'] = max(rss_mb)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('url')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--token', help='Токен авторизации пользователя.')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--client-delay', type=float, default=0)
+    parser.add_argument('--server-pid', type=int)
+    options = parser.parse_args()
+    report = asyncio.run(run(options))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()